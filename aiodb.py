@@ -0,0 +1,80 @@
+"""
+Concurrent execution of independent SQL statements for server.py's
+otherwise synchronous request handlers.
+
+AsyncDatabase keeps an asyncio event loop in a daemon thread, with a psycopg 3
+AsyncConnectionPool on it. run() hands that loop a batch of (sql, params)
+statements, which it executes with asyncio.gather, each on its own pooled
+connection. The calling thread blocks until the whole batch is done, so it
+waits as long as the slowest statement rather than the sum of all of them.
+psycopg 3 takes the same %(name)s placeholders as psycopg2, so the SQL strings
+are shared with the synchronous path.
+
+The loop and pool are created on first use in each process, so they are never
+shared with prefork workers. Needs the psycopg and psycopg_pool packages.
+"""
+
+import asyncio, os, threading, time
+
+
+def conninfo(uri):
+    """
+    Turn an SQLAlchemy URL (postgresql+psycopg2://...) into a libpq URI.
+    """
+    scheme, sep, rest=uri.partition('://')
+    return scheme.split('+')[0]+sep+rest
+
+
+class AsyncDatabase(object):
+
+    def __init__(self, uri, min_size=1, max_size=10, timeout=30):
+        self.uri=conninfo(uri)
+        self.min_size=min_size
+        self.max_size=max_size
+        self.timeout=timeout
+        self.loop=None
+        self.pool=None
+        self.pid=None
+        self.lock=threading.Lock()
+
+    def start(self):
+        if self.pid==os.getpid():
+            return
+        with self.lock:
+            if self.pid==os.getpid():
+                return
+            from psycopg.rows import dict_row
+            from psycopg_pool import AsyncConnectionPool
+            loop=asyncio.new_event_loop()
+            thread=threading.Thread(target=loop.run_forever)
+            thread.daemon=True
+            thread.start()
+
+            async def open_pool():
+                # the pool binds to the running loop, so it is built on it
+                pool=AsyncConnectionPool(self.uri, min_size=self.min_size, max_size=self.max_size,
+                                         timeout=self.timeout, open=False,
+                                         kwargs={'autocommit': True, 'row_factory': dict_row})
+                await pool.open()
+                return pool
+            self.pool=asyncio.run_coroutine_threadsafe(open_pool(), loop).result()
+            self.loop=loop
+            self.pid=os.getpid()
+
+    async def fetch(self, sql, params):
+        async with self.pool.connection() as conn:
+            start=time.time()
+            cursor=await conn.execute(sql, params)
+            rows=await cursor.fetchall() if cursor.description else []
+            return rows, time.time()-start
+
+    async def gather(self, statements):
+        return await asyncio.gather(*[self.fetch(sql, params) for sql, params in statements], return_exceptions=True)
+
+    def run(self, statements):
+        """
+        Execute [(sql, params)] concurrently. Returns, in order, (rows, seconds)
+        for each statement, or the exception it raised.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.gather(statements), self.loop).result()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""
+Load test for server.py against a local Postgres fixture.
+
+    python bench/bench.py --scale 1 --concurrency 8 --duration 30 --output results.json
+
+By default this starts a throw-away Postgres cluster (initdb/pg_ctl must be
+on PATH or under /usr/lib/postgresql/*/bin), creates bench/schema.sql, loads
+a synthetic Yelp-shaped dataset (bench/dataset.py), applies migrations/*.sql
+and drives the Flask app in-process from concurrent client threads, counting
+the SQL statements each request issues.
+
+Use --database-uri to benchmark against an existing (already loaded)
+database instead, and --url to drive an already running server over HTTP
+(queries per request are then read from the X-Query-Count response header
+when the server sends one).
+
+The report is JSON: per route request/error counts, p50/p95/p99/mean latency
+in milliseconds, throughput and queries per request, plus the git commit, so
+runs can be compared with --compare.
+
+--detail-queries both runs the load twice in-process, once with the detail
+page's independent queries run one after another (sync) and once concurrently
+on the asyncio pool (async), and compares the two; e.g.
+
+    python bench/bench.py --detail-queries both --routes /show_restaurant_details --detail-cache-url 'local://?size=0'
+
+(a zero-size detail cache makes every detail request reach the database).
+"""
+
+import argparse, glob, json, os, random, shutil, socket, subprocess, sys, tempfile, threading, time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import dataset
+
+
+#
+# local Postgres fixture
+#
+def find_pg_bin(name):
+    path=shutil.which(name)
+    if path:
+        return path
+    candidates=sorted(glob.glob('/usr/lib/postgresql/*/bin/'+name)+glob.glob('/usr/local/pgsql/bin/'+name))
+    if not candidates:
+        raise RuntimeError('%s not found; install PostgreSQL or pass --database-uri' % name)
+    return candidates[-1]
+
+
+def free_port():
+    sock=socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port=sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class LocalPostgres(object):
+    """
+    A throw-away cluster in a temporary directory, listening on a unix socket.
+    """
+
+    def __init__(self):
+        self.dir=tempfile.mkdtemp(prefix='db1-bench-')
+        self.data=os.path.join(self.dir, 'data')
+        self.port=free_port()
+
+    def start(self):
+        subprocess.check_call([find_pg_bin('initdb'), '-D', self.data, '-U', 'bench', '--auth', 'trust', '-E', 'UTF8'],
+                              stdout=subprocess.DEVNULL)
+        subprocess.check_call([find_pg_bin('pg_ctl'), '-D', self.data, '-w', '-l', os.path.join(self.dir, 'postgres.log'),
+                               '-o', "-p %d -k %s -c listen_addresses=''" % (self.port, self.dir), 'start'],
+                              stdout=subprocess.DEVNULL)
+        import psycopg2
+        conn=psycopg2.connect(dbname='postgres', user='bench', host=self.dir, port=self.port)
+        conn.autocommit=True
+        conn.cursor().execute('CREATE DATABASE bench')
+        conn.close()
+        return 'postgresql://bench@/bench?host=%s&port=%d' % (self.dir, self.port)
+
+    def stop(self):
+        subprocess.call([find_pg_bin('pg_ctl'), '-D', self.data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def run_sql_file(dsn, path):
+    import psycopg2
+    conn=psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(open(path).read())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def setup_database(dsn, scale, migrations=True):
+    run_sql_file(dsn, os.path.join(BENCH_DIR, 'schema.sql'))
+    start=time.time()
+    counts=dataset.load(dsn, scale)
+    print('loaded %s in %.1fs' % (counts, time.time()-start), file=sys.stderr)
+    if migrations:
+        for path in sorted(glob.glob(os.path.join(ROOT_DIR, 'migrations', '*.sql'))):
+            try:
+                run_sql_file(dsn, path)
+            except Exception as e:
+                # e.g. an extension that is not installed on this machine
+                print('skipped %s: %s' % (os.path.basename(path), str(e).strip()), file=sys.stderr)
+    return counts
+
+
+#
+# request mix
+#
+def route_requests(scale):
+    """
+    Return [(route name, weight, factory)]; a factory takes a random.Random and
+    returns (method, path, form data or None).
+    """
+    rids=['r%07d' % i for i in range(scale.restaurants)]
+    weights=[1.0/(i+1) for i in range(len(rids))]
+
+    def search(rng):
+        form={'noiselevel': 'Not Specified', 'stars': 'Not Specified', 'wifi': 'Not Specified'}
+        city, state, _, _=rng.choice(dataset.CITIES)
+        choice=rng.random()
+        if choice<0.4:
+            form['city']=city
+        elif choice<0.7:
+            form['state']=state
+            form['categories']=rng.choice(dataset.STYLES)
+        else:
+            form['categories']=rng.choice(dataset.STYLES)
+            form['stars']=rng.choice(['3', '4', '5'])
+        return 'POST', '/search_restaurants_act', form
+
+    def fuzzy_search(rng):
+        return 'POST', '/search_restaurants_fuzzy_act', {'r_name': rng.choice(dataset.NAME_NOUNS).lower()[:4],
+                                                          'noiselevel': 'Not Specified', 'stars': 'Not Specified',
+                                                          'wifi': 'Not Specified'}
+
+    return [
+        ('/', 3, lambda rng: ('GET', '/', None)),
+        ('/search_restaurants_act', 2, search),
+        ('/search_restaurants_fuzzy_act', 1, fuzzy_search),
+        ('/show_restaurant_details', 5, lambda rng: ('GET', '/show_restaurant_details?rid='+rng.choices(rids, weights=weights)[0], None)),
+        ('/show_friend_list', 1, lambda rng: ('GET', '/show_friend_list', None)),
+        ('/show_bookmark_list', 1, lambda rng: ('GET', '/show_bookmark_list', None)),
+    ]
+
+
+#
+# clients
+#
+class InProcessClient(object):
+    """
+    Drives the Flask app through its test client; counts the statements the
+    request thread sends to Postgres via SQLAlchemy cursor events, or takes the
+    server's X-Query-Count when that is higher (it includes async queries).
+    """
+
+    counter=threading.local()
+
+    @classmethod
+    def install(cls, server):
+        from sqlalchemy import event
+
+        @event.listens_for(server.engine, 'before_cursor_execute')
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            cls.counter.queries=getattr(cls.counter, 'queries', 0)+1
+
+    def __init__(self, server):
+        self.client=server.app.test_client()
+
+    def request(self, method, path, form=None):
+        self.counter.queries=0
+        if method=='POST':
+            response=self.client.post(path, data=form)
+        else:
+            response=self.client.get(path)
+        response.get_data()
+        queries=response.headers.get('X-Query-Count')
+        return response.status_code, max(self.counter.queries, int(queries) if queries is not None else 0)
+
+
+class HttpClient(object):
+    """
+    Drives a running server over HTTP, keeping the session cookie.
+    """
+
+    def __init__(self, base_url):
+        import http.cookiejar, urllib.request
+        self.base_url=base_url.rstrip('/')
+        self.opener=urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, form=None):
+        import urllib.error, urllib.parse
+        data=urllib.parse.urlencode(form).encode() if method=='POST' else None
+        try:
+            response=self.opener.open(self.base_url+path, data=data)
+            status=response.status
+        except urllib.error.HTTPError as e:
+            response=e
+            status=e.code
+        response.read()
+        queries=response.headers.get('X-Query-Count')
+        return status, int(queries) if queries is not None else None
+
+
+#
+# driver
+#
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index=min(len(sorted_values)-1, max(0, int(round(p/100.0*len(sorted_values)+0.5))-1))
+    return sorted_values[index]
+
+
+def run_load(make_client, routes, concurrency, duration, warmup, users, seed):
+    samples=dict((name, []) for name, _, _ in routes)  # name -> [(latency, status, queries)]
+    lock=threading.Lock()
+    deadline=[None]
+
+    def worker(n):
+        rng=random.Random(seed+n)
+        client=make_client()
+        uid=rng.randint(1, users)
+        client.request('POST', '/login_act', {'account': 'user%d' % uid, 'password': 'pw'})
+        names=[name for name, _, _ in routes]
+        weights=[weight for _, weight, _ in routes]
+        factories=dict((name, factory) for name, _, factory in routes)
+        local=[]
+        while deadline[0] is None or time.time()<deadline[0]:
+            name=rng.choices(names, weights=weights)[0]
+            method, path, form=factories[name](rng)
+            start=time.time()
+            try:
+                status, queries=client.request(method, path, form)
+            except Exception:
+                status, queries=None, None
+            elapsed=time.time()-start
+            if deadline[0] is not None:
+                local.append((name, elapsed, status, queries))
+        with lock:
+            for name, elapsed, status, queries in local:
+                samples[name].append((elapsed, status, queries))
+
+    threads=[threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    start=time.time()
+    deadline[0]=start+duration
+    for thread in threads:
+        thread.join()
+    wall=time.time()-start
+
+    report={}
+    for name, rows in samples.items():
+        latencies=sorted(r[0]*1000.0 for r in rows)
+        queries=[r[2] for r in rows if r[2] is not None]
+        report[name]=dict(
+            requests=len(rows),
+            errors=sum(1 for r in rows if r[1] is None or r[1]>=400),
+            p50_ms=percentile(latencies, 50),
+            p95_ms=percentile(latencies, 95),
+            p99_ms=percentile(latencies, 99),
+            mean_ms=sum(latencies)/len(latencies) if latencies else None,
+            throughput_rps=len(rows)/wall,
+            queries_per_request=float(sum(queries))/len(queries) if queries else None,
+        )
+    total=sum(r['requests'] for r in report.values())
+    return dict(routes=report, total_requests=total, throughput_rps=total/wall, wall_seconds=wall)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(old, new):
+    """
+    Print the change of p95 latency and queries per request against an old report.
+    """
+    print('%-32s %12s %12s %8s %10s %10s' % ('route', 'old p95 ms', 'new p95 ms', 'ratio', 'old q/req', 'new q/req'))
+    for name, stats in sorted(new['routes'].items()):
+        before=old['routes'].get(name)
+        if not before or not before['p95_ms'] or not stats['p95_ms']:
+            continue
+        print('%-32s %12.2f %12.2f %8.2f %10s %10s' % (name, before['p95_ms'], stats['p95_ms'], stats['p95_ms']/before['p95_ms'],
+                                                      before['queries_per_request'], stats['queries_per_request']))
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='dataset scale (1 = 1,000 restaurants)')
+    parser.add_argument('--reviews-per-restaurant', type=int, default=20)
+    parser.add_argument('--tips-per-restaurant', type=int, default=5)
+    parser.add_argument('--friends-per-user', type=int, default=20)
+    parser.add_argument('--bookmarks-per-user', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='unmeasured seconds before measuring')
+    parser.add_argument('--seed', type=int, default=4111)
+    parser.add_argument('--database-uri', help='use an existing, already loaded database')
+    parser.add_argument('--url', help='drive a running server over HTTP instead of in-process')
+    parser.add_argument('--no-migrations', action='store_true', help='do not apply migrations/*.sql to the fixture')
+    parser.add_argument('--keep', action='store_true', help='print the fixture URI and keep it running')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    parser.add_argument('--routes', help='comma-separated routes to drive (default: the whole mix)')
+    parser.add_argument('--detail-queries', choices=['sync', 'async', 'both'],
+                        help='how the detail page runs its independent queries (in-process only)')
+    parser.add_argument('--detail-cache-url', help='DETAIL_CACHE_URL for the in-process server')
+    args=parser.parse_args()
+
+    scale=dataset.Scale(args.scale, args.reviews_per_restaurant, args.tips_per_restaurant,
+                        args.friends_per_user, args.bookmarks_per_user)
+    routes=route_requests(scale)
+    if args.routes:
+        names=args.routes.split(',')
+        routes=[route for route in routes if route[0] in names]
+        if not routes:
+            parser.error('no such routes: %s' % args.routes)
+    if args.url and (args.detail_queries or args.detail_cache_url):
+        parser.error('--detail-queries and --detail-cache-url need the in-process server')
+    fixture=None
+    database_uri=args.database_uri
+    try:
+        if database_uri is None and args.url is None:
+            fixture=LocalPostgres()
+            database_uri=fixture.start()
+            setup_database(database_uri, scale, migrations=not args.no_migrations)
+            if args.keep:
+                print('fixture: %s' % database_uri, file=sys.stderr)
+
+        modes=[None]
+        if args.url:
+            make_client=lambda: HttpClient(args.url)
+        else:
+            os.environ['DATABASEURI']=database_uri
+            if args.detail_cache_url:
+                os.environ['DETAIL_CACHE_URL']=args.detail_cache_url
+            sys.path.insert(0, ROOT_DIR)
+            import server
+            server.app.secret_key=os.urandom(12)
+            InProcessClient.install(server)
+            make_client=lambda: InProcessClient(server)
+            if args.detail_queries:
+                modes=['sync', 'async'] if args.detail_queries=='both' else [args.detail_queries]
+
+        reports={}
+        for mode in modes:
+            if mode is not None:
+                server.DETAIL_QUERIES=mode
+            reports[mode]=run_load(make_client, routes, args.concurrency, args.duration, args.warmup, scale.users, args.seed)
+        result=reports[modes[0]] if len(modes)==1 else dict(modes=reports)
+        result.update(commit=git_commit(), timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                      config=dict(vars(args), scale=scale.as_dict(), mode='http' if args.url else 'inprocess'))
+    finally:
+        if fixture is not None and not args.keep:
+            fixture.stop()
+
+    text=json.dumps(result, indent=2, sort_keys=True, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text+'\n')
+    else:
+        print(text)
+    if len(modes)>1:
+        print('sync (old) vs async (new):')
+        compare(reports['sync'], reports['async'])
+    if args.compare and len(modes)==1:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
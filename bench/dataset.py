@@ -0,0 +1,150 @@
+"""
+Synthetic Yelp-shaped dataset for the benchmark fixture.
+
+The generator is seeded, so the same scale always produces the same rows.
+Tables are loaded with COPY FROM STDIN through psycopg2.
+"""
+
+import csv, datetime, io, random
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+STYLES = ['Pizza', 'Chinese', 'Mexican', 'Italian', 'Japanese', 'Sushi Bars', 'Burgers', 'Thai', 'Indian',
+          'Korean', 'Vegan', 'Breakfast & Brunch', 'Cafes', 'Bakeries', 'Seafood', 'Steakhouses', 'Bars']
+CITIES = [('Las Vegas', 'NV', 36.17, -115.14), ('Phoenix', 'AZ', 33.45, -112.07), ('Toronto', 'ON', 43.65, -79.38),
+          ('Charlotte', 'NC', 35.23, -80.84), ('Pittsburgh', 'PA', 40.44, -79.99), ('Montreal', 'QC', 45.50, -73.57),
+          ('Cleveland', 'OH', 41.50, -81.69), ('Madison', 'WI', 43.07, -89.40), ('New York', 'NY', 40.81, -73.96)]
+WORDS = ['good', 'great', 'tasty', 'slow', 'friendly', 'cheap', 'pricey', 'fresh', 'cozy', 'loud', 'spicy',
+         'crispy', 'amazing', 'decent', 'bland', 'service', 'staff', 'portion', 'menu', 'place', 'food']
+NAME_WORDS = ['Golden', 'Red', 'Happy', 'Little', 'Royal', 'Blue', 'Lucky', 'Old', 'Urban', 'Green', 'Smokey']
+NAME_NOUNS = ['Dragon', 'Garden', 'Kitchen', 'Grill', 'Bistro', 'House', 'Diner', 'Taqueria', 'Noodle', 'Oven']
+MEALTYPES = ['dessert', 'latenight', 'dinner', 'lunch', 'breakfast', 'brunch']
+AMBIENCES = ['romantic', 'intimate', 'classy', 'hipster', 'touristy', 'trendy', 'upscale', 'casual']
+FLAGS = ['smoking', 'dogsallowed', 'hastv', 'accepts_credit_cards', 'goodforkids', 'garage', 'street', 'lot', 'valet']
+
+
+class Scale(object):
+    """
+    Row counts for a given scale factor (1 = 1,000 restaurants).
+    """
+
+    def __init__(self, factor=1.0, reviews_per_restaurant=20, tips_per_restaurant=5,
+                 friends_per_user=20, bookmarks_per_user=10):
+        self.restaurants=max(1, int(1000*factor))
+        self.users=max(2, int(2000*factor))
+        self.reviews=self.restaurants*reviews_per_restaurant
+        self.tips=self.restaurants*tips_per_restaurant
+        self.friends_per_user=min(friends_per_user, self.users-1)
+        self.bookmarks_per_user=min(bookmarks_per_user, self.restaurants)
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def random_date(rng, start_year=2008, end_year=2018):
+    start=datetime.date(start_year, 1, 1)
+    return start+datetime.timedelta(days=rng.randrange((datetime.date(end_year, 12, 31)-start).days))
+
+
+def generate(scale, seed=4111):
+    """
+    Yield (table, columns, rows) for every table of bench/schema.sql.
+    """
+    rng=random.Random(seed)
+    rids=['r%07d' % i for i in range(scale.restaurants)]
+    uids=['%d' % (i+1) for i in range(scale.users)]
+
+    restaurant_columns=['rid', 'r_name', 'stars', 'price', 'noiselevel', 'wifi', 'alcohol']+FLAGS+MEALTYPES+AMBIENCES
+    restaurants=[]
+    locations=[]
+    open_location=[]
+    for i, rid in enumerate(rids):
+        row=[rid, '%s %s %d' % (rng.choice(NAME_WORDS), rng.choice(NAME_NOUNS), i), rng.choice([1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5]),
+             rng.randint(1, 4), rng.choice(['average', 'quiet', 'loud', None]), rng.choice(['free', 'paid', 'no']),
+             rng.choice(['full_bar', 'beer_and_wine', 'none'])]
+        row+=[str(rng.random()<0.5) for _ in FLAGS+MEALTYPES+AMBIENCES]
+        restaurants.append(row)
+        city, state, lat, lon=rng.choice(CITIES)
+        address='%d %s St' % (i+1, rng.choice(NAME_NOUNS))
+        postal_code='%05d' % rng.randrange(100000)
+        locations.append([address, postal_code, lat+rng.uniform(-0.3, 0.3), lon+rng.uniform(-0.3, 0.3), city, state])
+        open_location.append([rid, address, postal_code])
+    yield 'restaurants', restaurant_columns, restaurants
+    yield 'location', ['address', 'postal_code', 'latitude', 'longitude', 'city', 'state'], locations
+    yield 'open_location', ['rid', 'address', 'postal_code'], open_location
+
+    categories=[]
+    hours=[]
+    checkins=[]
+    photos=[]
+    for rid in rids:
+        for style in rng.sample(STYLES, rng.randint(1, 3)):
+            categories.append([rid, style])
+        for day in WEEKDAYS:
+            if rng.random()<0.85:
+                hours.append([rid, day, '%02d:00' % rng.randint(6, 12), '%02d:00' % rng.randint(17, 23)])
+        for day in WEEKDAYS:
+            for hour in rng.sample(range(24), rng.randint(0, 8)):
+                checkins.append([rid, day, '%02d:00' % hour, rng.randint(1, 50)])
+        for p in range(rng.randint(0, 3)):
+            photos.append(['%s-p%d' % (rid, p), rid, sentence(rng, 4), rng.choice(['food', 'inside', 'outside', 'drink'])])
+    yield 'categories', ['rid', 'style'], categories
+    yield 'open_hours', ['rid', 'day', 'open', 'close'], hours
+    yield 'checkin', ['rid', 'weekday', 'hour', 'counts'], checkins
+    yield 'has_photo', ['pid', 'rid', 'caption', 'label'], photos
+
+    users=[[uid, 'user%s' % uid, 'user%s' % uid, 'pw', random_date(rng)] for uid in uids]
+    yield 'users', ['uid', 'u_name', 'account', 'password', 'since'], users
+
+    friends=[]
+    bookmarks=[]
+    for uid in uids:
+        others=[other for other in rng.sample(uids, scale.friends_per_user+1) if other!=uid]
+        for other in others[:scale.friends_per_user]:
+            friends.append([uid, other])
+        for rid in rng.sample(rids, scale.bookmarks_per_user):
+            bookmarks.append([uid, rid])
+    yield 'friends', ['uid_a', 'uid_b'], friends
+    yield 'bookmarks', ['uid', 'rid'], bookmarks
+
+    # popularity is skewed so a few restaurants carry most reviews, like Yelp
+    weights=[1.0/(i+1) for i in range(len(rids))]
+    review_rids=rng.choices(rids, weights=weights, k=scale.reviews)
+    reviews=[['%d' % (i+1), rng.randint(1, 5), sentence(rng, 30), rng.randint(0, 20), rng.randint(0, 10),
+              rng.randint(0, 10), random_date(rng), rng.choice(uids), rid] for i, rid in enumerate(review_rids)]
+    yield 'reviews', ['review_id', 'rating', 'plaintext', 'useful', 'funny', 'cool', 'date', 'uid', 'rid'], reviews
+
+    tip_rids=rng.choices(rids, weights=weights, k=scale.tips)
+    tips=[['%d' % (i+1), rng.choice(uids), rid, sentence(rng, 8), random_date(rng)] for i, rid in enumerate(tip_rids)]
+    yield 'tip_writes', ['tid', 'uid', 'rid', 't_text', 't_date'], tips
+
+
+def copy_rows(cursor, table, columns, rows):
+    buf=io.StringIO()
+    writer=csv.writer(buf)
+    for row in rows:
+        writer.writerow(['' if v is None else v for v in row])
+    buf.seek(0)
+    cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table, ', '.join(columns)), buf)
+
+
+def load(dsn, scale, seed=4111):
+    """
+    Generate the dataset and COPY it into an empty schema; returns row counts.
+    """
+    import psycopg2
+    counts={}
+    conn=psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            for table, columns, rows in generate(scale, seed):
+                copy_rows(cursor, table, columns, rows)
+                counts[table]=len(rows)
+            cursor.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
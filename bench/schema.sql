@@ -0,0 +1,123 @@
+-- Yelp-shaped schema used by the benchmark fixture (bench/bench.py).
+-- It mirrors the tables and columns server.py reads and writes; attribute
+-- flags are stored as 'True' / 'False' text like the imported dataset.
+
+CREATE TABLE restaurants (
+    rid text PRIMARY KEY,
+    r_name text,
+    stars numeric(2, 1),
+    price integer,
+    noiselevel text,
+    wifi text,
+    smoking text,
+    dogsallowed text,
+    hastv text,
+    accepts_credit_cards text,
+    goodforkids text,
+    alcohol text,
+    garage text,
+    street text,
+    lot text,
+    valet text,
+    dessert text,
+    latenight text,
+    dinner text,
+    lunch text,
+    breakfast text,
+    brunch text,
+    romantic text,
+    intimate text,
+    classy text,
+    hipster text,
+    touristy text,
+    trendy text,
+    upscale text,
+    casual text
+);
+
+CREATE TABLE categories (
+    rid text REFERENCES restaurants,
+    style text,
+    PRIMARY KEY (rid, style)
+);
+
+CREATE TABLE location (
+    address text,
+    postal_code text,
+    latitude double precision,
+    longitude double precision,
+    city text,
+    state text,
+    PRIMARY KEY (address, postal_code)
+);
+
+CREATE TABLE open_location (
+    rid text REFERENCES restaurants,
+    address text,
+    postal_code text,
+    PRIMARY KEY (rid, address, postal_code),
+    FOREIGN KEY (address, postal_code) REFERENCES location
+);
+
+CREATE TABLE open_hours (
+    rid text REFERENCES restaurants,
+    day text,
+    open time,
+    close time,
+    PRIMARY KEY (rid, day)
+);
+
+CREATE TABLE checkin (
+    rid text REFERENCES restaurants,
+    weekday text,
+    hour time,
+    counts integer,
+    PRIMARY KEY (rid, weekday, hour)
+);
+
+CREATE TABLE has_photo (
+    pid text PRIMARY KEY,
+    rid text REFERENCES restaurants,
+    caption text,
+    label text
+);
+
+CREATE TABLE users (
+    uid text PRIMARY KEY,
+    u_name text,
+    account text UNIQUE,
+    password text,
+    since date
+);
+
+CREATE TABLE friends (
+    uid_a text REFERENCES users,
+    uid_b text REFERENCES users,
+    PRIMARY KEY (uid_a, uid_b)
+);
+
+CREATE TABLE bookmarks (
+    uid text REFERENCES users,
+    rid text REFERENCES restaurants,
+    PRIMARY KEY (uid, rid)
+);
+
+CREATE TABLE reviews (
+    review_id text PRIMARY KEY,
+    rating integer,
+    plaintext text,
+    useful integer,
+    funny integer,
+    cool integer,
+    date date,
+    uid text REFERENCES users,
+    rid text REFERENCES restaurants
+);
+
+CREATE TABLE tip_writes (
+    tid text PRIMARY KEY,
+    uid text REFERENCES users,
+    rid text REFERENCES restaurants,
+    t_text text,
+    t_date date
+);
@@ -0,0 +1,154 @@
+"""
+Small read-through cache used by server.py for data that rarely changes
+(e.g. the static part of a restaurant detail page).
+
+Two backends share the same interface (get / set / delete / stats):
+
+    LocalCache  - in-process LRU with a per-entry TTL
+    RedisCache  - any client with redis-py's get/setex/delete methods
+    NullCache   - caches nothing, for when a local cache would go stale
+
+make_cache() picks one from a URL such as "local://?size=1000&ttl=300",
+"redis://localhost:6379/0?ttl=300" or "none://".
+"""
+
+import pickle, threading, time
+from collections import OrderedDict
+
+try:
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from urlparse import urlparse, parse_qs
+
+
+class CacheStats(object):
+
+    def __init__(self):
+        self.hits=0
+        self.misses=0
+        self.sets=0
+        self.deletes=0
+        self.evictions=0
+
+    def as_dict(self):
+        lookups=self.hits+self.misses
+        return dict(hits=self.hits, misses=self.misses, sets=self.sets, deletes=self.deletes,
+                    evictions=self.evictions, hit_ratio=float(self.hits)/lookups if lookups else 0.0)
+
+
+class LocalCache(object):
+    """
+    Thread-safe LRU cache; entries also expire ttl seconds after being set.
+    Values are stored as-is, so callers must not mutate what get() returns.
+    """
+
+    def __init__(self, size=1000, ttl=300):
+        self.size=size
+        self.ttl=ttl
+        self.entries=OrderedDict()  # key -> (expires_at, value)
+        self.lock=threading.Lock()
+        self.stats=CacheStats()
+
+    def get(self, key):
+        with self.lock:
+            entry=self.entries.get(key)
+            if entry is None or entry[0]<time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.stats.misses+=1
+                return None
+            self.entries.move_to_end(key)
+            self.stats.hits+=1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key]=(time.time()+self.ttl, value)
+            self.entries.move_to_end(key)
+            self.stats.sets+=1
+            while len(self.entries)>self.size:
+                self.entries.popitem(last=False)
+                self.stats.evictions+=1
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                if self.entries.pop(key, None) is not None:
+                    self.stats.deletes+=1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RedisCache(object):
+    """
+    Cache backed by a Redis-compatible client; values are pickled.
+    """
+
+    def __init__(self, client, ttl=300, prefix='db1:'):
+        self.client=client
+        self.ttl=ttl
+        self.prefix=prefix
+        self.lock=threading.Lock()
+        self.stats=CacheStats()
+
+    def get(self, key):
+        data=self.client.get(self.prefix+key)
+        with self.lock:
+            if data is None:
+                self.stats.misses+=1
+                return None
+            self.stats.hits+=1
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        self.client.setex(self.prefix+key, self.ttl, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            self.stats.sets+=1
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix+key for key in keys])
+            with self.lock:
+                self.stats.deletes+=len(keys)
+
+
+class NullCache(object):
+    """
+    Every get() misses. Used instead of LocalCache when several processes
+    serve requests, since deleting from one process's LocalCache leaves the
+    others serving stale entries.
+    """
+
+    def __init__(self):
+        self.stats=CacheStats()
+
+    def get(self, key):
+        self.stats.misses+=1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+def make_cache(url):
+    """
+    Build a cache from a URL: local://?size=N&ttl=S, redis://host:port/db?ttl=S or none://.
+    """
+    parsed=urlparse(url)
+    options=dict((k, v[0]) for k, v in parse_qs(parsed.query).items())
+    ttl=int(options.get('ttl', 300))
+    if parsed.scheme=='local':
+        return LocalCache(size=int(options.get('size', 1000)), ttl=ttl)
+    if parsed.scheme=='none':
+        return NullCache()
+    if parsed.scheme in ('redis', 'rediss'):
+        import redis
+        return RedisCache(redis.Redis.from_url(url.split('?')[0]), ttl=ttl)
+    raise ValueError('unknown cache backend: %s' % url)
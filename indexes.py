@@ -0,0 +1,297 @@
+"""
+In-process indexes used by server.py when the database does not provide an
+equivalent (e.g. the pg_trgm or earthdistance extensions are not installed),
+or to answer hot lookups (autocomplete) without a query.
+"""
+
+import bisect, heapq, math, re
+
+
+#
+# Trigram index
+#
+# Mirrors pg_trgm: every word is lower-cased and padded with two spaces in
+# front and one behind before it is cut into trigrams, and similarity is
+# |A & B| / |A | B| over the two trigram sets.
+#
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def trigrams(text, padded=True):
+    grams=set()
+    for word in WORD_RE.findall(text.lower()):
+        if padded:
+            word='  '+word+' '
+        for i in range(len(word)-2):
+            grams.add(word[i:i+3])
+    return grams
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return float(len(a & b)) / len(a | b)
+
+
+class NgramIndex(object):
+    """
+    Maps text values to sets of keys (e.g. a category style to the rids that
+    have it) and answers case-insensitive substring queries ranked by trigram
+    similarity, like ILIKE '%term%' ORDER BY similarity(value, term) DESC.
+    """
+
+    def __init__(self):
+        self.values={}    # value -> (trigram set, set of keys)
+        self.postings={}  # trigram -> set of values
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value, key):
+        if value is None:
+            return
+        entry=self.values.get(value)
+        if entry is None:
+            entry=self.values[value]=(trigrams(value), set())
+            for gram in entry[0]:
+                self.postings.setdefault(gram, set()).add(value)
+        entry[1].add(key)
+
+    def candidates(self, term):
+        # any value containing the term also contains the term's unpadded trigrams
+        grams=trigrams(term, padded=False)
+        if not grams:
+            return self.values.keys()
+        found=None
+        for gram in sorted(grams, key=lambda gm: len(self.postings.get(gm, ()))):
+            values=self.postings.get(gram)
+            if not values:
+                return []
+            found=set(values) if found is None else found & values
+            if not found:
+                return []
+        return found
+
+    def search(self, term):
+        """
+        Return {key: score} for every key whose value contains term.
+        """
+        term_lower=term.lower()
+        term_grams=trigrams(term)
+        scores={}
+        for value in self.candidates(term):
+            if term_lower not in value.lower():
+                continue
+            value_grams, keys=self.values[value]
+            score=similarity(value_grams, term_grams)
+            for key in keys:
+                if score>scores.get(key, -1.0):
+                    scores[key]=score
+        return scores
+
+
+#
+# KD-tree for nearest-neighbour queries on (latitude, longitude)
+#
+# Points are stored as 3-d unit vectors, so straight-line (chord) distance is
+# monotonic in great-circle distance and the usual axis-aligned pruning is
+# exact; distances reported back are haversine kilometres.
+#
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_xyz(latitude, longitude):
+    lat=math.radians(latitude)
+    lon=math.radians(longitude)
+    return (math.cos(lat)*math.cos(lon), math.cos(lat)*math.sin(lon), math.sin(lat))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2=map(math.radians, (lat1, lon1, lat2, lon2))
+    a=math.sin((lat2-lat1)/2)**2+math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+    return 2*EARTH_RADIUS_KM*math.asin(min(1.0, math.sqrt(a)))
+
+
+def chord_for_km(distance_km):
+    return 2*math.sin(min(distance_km/EARTH_RADIUS_KM, math.pi)/2)
+
+
+class KDTree(object):
+    """
+    Static 3-d tree over (latitude, longitude, payload) points.
+    """
+
+    def __init__(self, points):
+        self.size=0
+        items=[]
+        for latitude, longitude, payload in points:
+            if latitude is None or longitude is None:
+                continue
+            items.append((to_xyz(latitude, longitude), latitude, longitude, payload))
+        self.size=len(items)
+        self.root=self._build(items, 0)
+
+    def __len__(self):
+        return self.size
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis=depth%3
+        items.sort(key=lambda item: item[0][axis])
+        mid=len(items)//2
+        # node: (item, axis, left, right)
+        return (items[mid], axis, self._build(items[:mid], depth+1), self._build(items[mid+1:], depth+1))
+
+    def nearest(self, latitude, longitude, k, radius_km=None, predicate=None):
+        """
+        Return up to k [(distance_km, latitude, longitude, payload)] closest to
+        the given point, nearest first, optionally within radius_km and only
+        for payloads accepted by predicate.
+        """
+        if k<=0 or self.root is None:
+            return []
+        target=to_xyz(latitude, longitude)
+        bound=chord_for_km(radius_km)**2 if radius_km is not None else float('inf')
+        heap=[]  # max-heap on squared chord distance: (-dist, tie, item)
+        stack=[self.root]
+        while stack:
+            node=stack.pop()
+            if node is None:
+                continue
+            item, axis, left, right=node
+            point=item[0]
+            dist=sum((point[i]-target[i])**2 for i in range(3))
+            worst=-heap[0][0] if len(heap)==k else bound
+            if dist<=min(worst, bound) and (predicate is None or predicate(item[3])):
+                entry=(-dist, id(item), item)
+                if len(heap)<k:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heapreplace(heap, entry)
+            diff=target[axis]-point[axis]
+            near, far=(left, right) if diff<0 else (right, left)
+            worst=-heap[0][0] if len(heap)==k else bound
+            # visit the near side first (pushed last), the far side only if it can still hold a closer point
+            if diff*diff<=min(worst, bound):
+                stack.append(far)
+            stack.append(near)
+        results=[]
+        for _, _, item in heap:
+            results.append((haversine_km(latitude, longitude, item[1], item[2]), item[1], item[2], item[3]))
+        results.sort(key=lambda r: r[0])
+        return results
+
+
+#
+# Interval tree for stabbing queries ("which intervals contain x")
+#
+# A centered interval tree: every node keeps the intervals that contain its
+# center, sorted by start and by end, so a query only walks one root-to-leaf
+# path and stops scanning a node's list at the first interval that misses.
+#
+class IntervalTree(object):
+    """
+    Static tree over half-open [start, end) intervals with a payload each.
+    """
+
+    def __init__(self, intervals):
+        items=[(start, end, payload) for start, end, payload in intervals if start<end]
+        self.size=len(items)
+        self.root=self._build(items)
+
+    def __len__(self):
+        return self.size
+
+    def _build(self, items):
+        if not items:
+            return None
+        points=sorted(p for start, end, _ in items for p in (start, end))
+        # the lower median always splits off at least one interval containing it
+        center=points[(len(points)-1)//2]
+        left, right, here=[], [], []
+        for item in items:
+            if item[1]<=center:
+                left.append(item)
+            elif item[0]>center:
+                right.append(item)
+            else:
+                here.append(item)
+        # node: (center, here by start, here by end descending, left, right)
+        return (center, sorted(here, key=lambda item: item[0]), sorted(here, key=lambda item: item[1], reverse=True),
+                self._build(left), self._build(right))
+
+    def stab(self, x):
+        """
+        Return the payloads of every interval with start <= x < end.
+        """
+        found=[]
+        node=self.root
+        while node is not None:
+            center, by_start, by_end, left, right=node
+            if x<center:
+                for start, _, payload in by_start:
+                    if start>x:
+                        break
+                    found.append(payload)
+                node=left
+            else:
+                for _, end, payload in by_end:
+                    if end<=x:
+                        break
+                    found.append(payload)
+                node=right
+        return found
+
+
+#
+# Prefix index for autocomplete
+#
+# A sorted array of (lower-cased key, value) pairs in which every word of a
+# value starts a key, so "piz" finds "Joe's Pizza". Short prefixes match the
+# largest ranges, so their best values are precomputed when the index is built.
+#
+class PrefixIndex(object):
+    """
+    Ranks the values matching a prefix by weight (e.g. popularity).
+    """
+
+    def __init__(self, weights, limit=10, memo_length=2):
+        self.weights=weights  # value -> weight
+        self.limit=limit
+        entries=[]
+        for value in weights:
+            if not value:
+                continue
+            lower=value.lower()
+            for match in WORD_RE.finditer(lower):
+                entries.append((lower[match.start():], value))
+        entries.sort()
+        self.keys=[key for key, _ in entries]
+        self.values=[value for _, value in entries]
+        self.memo={}
+        for prefix in set(key[:n] for key in self.keys for n in range(1, memo_length+1)):
+            self.memo[prefix]=self._search(prefix, limit)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def _search(self, prefix, limit):
+        lo=bisect.bisect_left(self.keys, prefix)
+        hi=bisect.bisect_left(self.keys, prefix+u'\uffff', lo)
+        values=set(self.values[lo:hi])
+        return [(value, self.weights[value]) for value in
+                heapq.nsmallest(limit, values, key=lambda value: (-self.weights[value], len(value), value))]
+
+    def search(self, prefix, limit=None):
+        """
+        Return up to limit [(value, weight)] having a word that starts with
+        prefix, heaviest first.
+        """
+        limit=self.limit if limit is None else limit
+        prefix=prefix.strip().lower()
+        if not prefix or limit<=0:
+            return []
+        if prefix in self.memo and limit<=self.limit:
+            return self.memo[prefix][:limit]
+        return self._search(prefix, limit)
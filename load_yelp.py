@@ -0,0 +1,548 @@
+#!/usr/bin/env python
+"""
+Bulk loader for the Yelp dataset JSON-lines dumps.
+
+    python load_yelp.py --dataset ~/yelp_dataset --jobs 4
+
+Every dump (business, checkin, photo, user, review, tip) is streamed line by
+line, transformed into the tables server.py uses and written in batches with
+COPY FROM STDIN into unlogged staging tables (yelp_stage_<table>) by --jobs
+parallel connections. Once a dump is staged it is merged into the real tables
+with one INSERT ... SELECT ... ON CONFLICT per table, which drops records whose
+restaurant or user is missing (e.g. businesses that are not restaurants).
+When a table is empty its secondary indexes are dropped before the merge and
+rebuilt afterwards (see --defer-indexes), and tables kept in sync by per-row
+triggers (checkin heatmap, open-hours intervals) are rebuilt once instead.
+The restaurant counters (restaurant_stats) are only kept up to date by the
+app's write paths, so they are recomputed after reviews or tips are merged.
+
+Progress is kept in the database: every batch commits together with its end
+offset in yelp_load_batches, so an interrupted load resumes where it stopped,
+and yelp_load_files remembers which dumps were merged. Re-running with a newer
+dump (different size or mtime) re-imports it incrementally: rows are upserted,
+nothing is truncated. --since skips reviews and tips older than a date.
+
+Timelines (FEED_MODE=push) are not touched; run `flask backfill-timelines`
+after a load if they are in use.
+"""
+
+import argparse, ast, csv, datetime, hashlib, io, json, os, queue, sys, threading, time
+
+DATABASEURI = os.environ.get('DATABASEURI')
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+FLAGS = [('smoking', 'Smoking'), ('dogsallowed', 'DogsAllowed'), ('hastv', 'HasTV'),
+         ('accepts_credit_cards', 'BusinessAcceptsCreditCards'), ('goodforkids', 'GoodForKids')]
+PARKING = ['garage', 'street', 'lot', 'valet']
+MEALTYPES = ['dessert', 'latenight', 'dinner', 'lunch', 'breakfast', 'brunch']
+AMBIENCES = ['romantic', 'intimate', 'classy', 'hipster', 'touristy', 'trendy', 'upscale', 'casual']
+
+RESTAURANT_COLUMNS = (['rid', 'r_name', 'stars', 'price', 'noiselevel', 'wifi']+[c for c, _ in FLAGS]+['alcohol']
+                      +PARKING+MEALTYPES+AMBIENCES)
+
+#
+# target tables: columns, primary key, columns updated on conflict and the
+# parents a staged row must have, as (parent table, [(column, parent column)])
+#
+TABLES = {
+    'restaurants': (RESTAURANT_COLUMNS, ['rid'], RESTAURANT_COLUMNS[1:], []),
+    'location': (['address', 'postal_code', 'latitude', 'longitude', 'city', 'state'], ['address', 'postal_code'],
+                 ['latitude', 'longitude', 'city', 'state'], []),
+    'open_location': (['rid', 'address', 'postal_code'], ['rid', 'address', 'postal_code'], [],
+                      [('restaurants', [('rid', 'rid')]), ('location', [('address', 'address'), ('postal_code', 'postal_code')])]),
+    'categories': (['rid', 'style'], ['rid', 'style'], [], [('restaurants', [('rid', 'rid')])]),
+    'open_hours': (['rid', 'day', 'open', 'close'], ['rid', 'day'], ['open', 'close'], [('restaurants', [('rid', 'rid')])]),
+    'checkin': (['rid', 'weekday', 'hour', 'counts'], ['rid', 'weekday', 'hour'], ['counts'], [('restaurants', [('rid', 'rid')])]),
+    'has_photo': (['pid', 'rid', 'caption', 'label'], ['pid'], ['rid', 'caption', 'label'], [('restaurants', [('rid', 'rid')])]),
+    # accounts and passwords of existing users are never overwritten
+    'users': (['uid', 'u_name', 'account', 'password', 'since'], ['uid'], ['u_name', 'since'], []),
+    'friends': (['uid_a', 'uid_b'], ['uid_a', 'uid_b'], [], [('users', [('uid_a', 'uid')]), ('users', [('uid_b', 'uid')])]),
+    'reviews': (['review_id', 'rating', 'plaintext', 'useful', 'funny', 'cool', 'date', 'uid', 'rid'], ['review_id'],
+                ['rating', 'plaintext', 'useful', 'funny', 'cool', 'date'],
+                [('users', [('uid', 'uid')]), ('restaurants', [('rid', 'rid')])]),
+    'tip_writes': (['tid', 'uid', 'rid', 't_text', 't_date'], ['tid'], ['t_text', 't_date'],
+                   [('users', [('uid', 'uid')]), ('restaurants', [('rid', 'rid')])]),
+}
+
+# per-row triggers that are disabled during a merge, and the function that
+# rebuilds what they maintain in one statement afterwards
+REBUILT_AFTER_MERGE = {
+    'checkin': 'rebuild_checkin_heatmap',
+    'open_hours': 'rebuild_open_intervals',
+}
+
+# tables whose merge leaves counters maintained by server.py stale, and the
+# function that recomputes them, run in the transaction marking the dump merged
+RECOUNTED_AFTER_MERGE = {
+    'reviews': 'reconcile_restaurant_stats',
+    'tip_writes': 'reconcile_restaurant_stats',
+}
+
+PROGRESS_SQL = """
+CREATE TABLE IF NOT EXISTS yelp_load_files (
+    name text PRIMARY KEY,
+    fingerprint text NOT NULL,
+    batch_size integer NOT NULL,
+    status text NOT NULL            -- 'staging', 'staged' or 'merged'
+);
+CREATE TABLE IF NOT EXISTS yelp_load_batches (
+    name text,
+    batch_no integer,
+    end_offset bigint NOT NULL,
+    PRIMARY KEY (name, batch_no)
+);
+CREATE TABLE IF NOT EXISTS yelp_load_indexes (
+    name text PRIMARY KEY,
+    tablename text NOT NULL,
+    definition text NOT NULL
+);
+"""
+
+
+#
+# record -> rows
+#
+def attribute(value):
+    """
+    Yelp attribute values are Python literals in strings ("u'average'", "True", "None").
+    """
+    if not isinstance(value, str):
+        return value
+    value=value.strip()
+    if value[:2] in ("u'", 'u"'):
+        value=value[1:]
+    if value[:1] in ("'", '"'):
+        value=value[1:-1]
+    return None if value in ('', 'None') else value
+
+
+def attribute_dict(value):
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str) or not value.startswith('{'):
+        return {}
+    try:
+        parsed=ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def flag(value):
+    value=attribute(value)
+    if value is None:
+        return None
+    return 'True' if value in (True, 'True', 'true') else 'False'
+
+
+def clock(value):
+    hour, minute=value.split(':')
+    return '%02d:%02d' % (int(hour), int(minute))
+
+
+def business_rows(record, context):
+    categories=record.get('categories') or ''
+    if isinstance(categories, list):
+        categories=', '.join(categories)
+    styles=[style.strip() for style in categories.split(',') if style.strip()]
+    if not context.all_businesses and 'Restaurants' not in styles:
+        return
+    rid=record['business_id']
+    attributes=record.get('attributes') or {}
+    try:
+        price=int(attribute(attributes.get('RestaurantsPriceRange2')))
+    except (TypeError, ValueError):
+        price=None
+    row=[rid, record.get('name'), record.get('stars'), price, attribute(attributes.get('NoiseLevel')),
+         attribute(attributes.get('WiFi'))]
+    row+=[flag(attributes.get(key)) for _, key in FLAGS]
+    row.append(attribute(attributes.get('Alcohol')))
+    for key, names in (('BusinessParking', PARKING), ('GoodForMeal', MEALTYPES), ('Ambience', AMBIENCES)):
+        values=attribute_dict(attributes.get(key))
+        row+=[flag(values.get(name)) for name in names]
+    yield 'restaurants', row
+
+    address=record.get('address') or ''
+    postal_code=record.get('postal_code') or ''
+    yield 'location', [address, postal_code, record.get('latitude'), record.get('longitude'),
+                       record.get('city'), record.get('state')]
+    yield 'open_location', [rid, address, postal_code]
+    for style in styles:
+        yield 'categories', [rid, style]
+    for day, hours in (record.get('hours') or {}).items():
+        try:
+            opens, closes=hours.split('-')
+            yield 'open_hours', [rid, day, clock(opens), clock(closes)]
+        except ValueError:
+            continue
+
+
+def checkin_rows(record, context):
+    rid=record['business_id']
+    if rid not in context.rids:
+        return
+    counts={}
+    if 'date' in record:
+        # "2016-04-26 19:49:16, 2016-08-30 18:36:57, ..."
+        for stamp in record['date'].split(','):
+            stamp=stamp.strip()
+            try:
+                day=datetime.date(int(stamp[0:4]), int(stamp[5:7]), int(stamp[8:10])).weekday()
+                key=(WEEKDAYS[day], int(stamp[11:13]))
+            except ValueError:
+                continue
+            counts[key]=counts.get(key, 0)+1
+    else:
+        # older dumps: {"time": {"Monday": {"11:00": 3, ...}, ...}}
+        for day, hours in (record.get('time') or {}).items():
+            for hour, count in hours.items():
+                key=(day, int(hour.split(':')[0]))
+                counts[key]=counts.get(key, 0)+count
+    for (day, hour), count in counts.items():
+        yield 'checkin', [rid, day, '%02d:00' % hour, count]
+
+
+def photo_rows(record, context):
+    if record['business_id'] in context.rids:
+        yield 'has_photo', [record['photo_id'], record['business_id'], record.get('caption'), record.get('label')]
+
+
+def user_rows(record, context):
+    uid=record['user_id']
+    since=record.get('yelping_since')
+    # imported users have no password, so they cannot log in until they set one
+    yield 'users', [uid, record.get('name'), uid, None, since[:10] if since else None]
+    friends=record.get('friends') or []
+    if isinstance(friends, str):
+        friends=[] if friends=='None' else friends.split(',')
+    for friend in friends:
+        friend=friend.strip()
+        if friend and friend!=uid:
+            yield 'friends', [uid, friend]
+
+
+def review_rows(record, context):
+    date=(record.get('date') or '')[:10]
+    if record['business_id'] not in context.rids or (context.since and date<context.since):
+        return
+    yield 'reviews', [record['review_id'], record.get('stars'), record.get('text'), record.get('useful', 0),
+                      record.get('funny', 0), record.get('cool', 0), date or None, record['user_id'], record['business_id']]
+
+
+def tip_rows(record, context):
+    date=(record.get('date') or '')[:10]
+    if record['business_id'] not in context.rids or (context.since and date<context.since):
+        return
+    # tips have no id in the dump; derive a stable one so re-imports upsert
+    key='%s|%s|%s|%s' % (record['user_id'], record['business_id'], record.get('date'), record.get('text'))
+    tid='t'+hashlib.md5(key.encode('utf-8')).hexdigest()[:21]
+    yield 'tip_writes', [tid, record['user_id'], record['business_id'], record.get('text'), date or None]
+
+
+# dumps in load order: name, tables it feeds (in merge order), transform
+DUMPS = [
+    ('business', ['restaurants', 'location', 'open_location', 'categories', 'open_hours'], business_rows),
+    ('checkin', ['checkin'], checkin_rows),
+    ('photo', ['has_photo'], photo_rows),
+    ('user', ['users', 'friends'], user_rows),
+    ('review', ['reviews'], review_rows),
+    ('tip', ['tip_writes'], tip_rows),
+]
+
+
+def find_dump(directory, name):
+    for filename in (name+'.json', 'yelp_academic_dataset_'+name+'.json'):
+        path=os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def fingerprint(path):
+    stat=os.stat(path)
+    return '%d:%d' % (stat.st_size, int(stat.st_mtime))
+
+
+#
+# staging
+#
+def connect(dsn):
+    import psycopg2
+    return psycopg2.connect(dsn.replace('postgresql+psycopg2://', 'postgresql://'))
+
+
+def stage_table(table):
+    return 'yelp_stage_'+table
+
+
+def to_csv(rows):
+    buf=io.StringIO()
+    writer=csv.writer(buf)
+    for row in rows:
+        writer.writerow(['\\N' if v is None else v for v in row])
+    return buf.getvalue()
+
+
+class CopyWorkers(object):
+    """
+    Threads that COPY batches into the staging tables, each on its own
+    connection. A batch commits together with its progress record.
+    """
+
+    def __init__(self, dsn, jobs):
+        self.queue=queue.Queue(maxsize=jobs*2)
+        self.errors=[]
+        self.threads=[threading.Thread(target=self.run, args=(dsn,)) for _ in range(jobs)]
+        for thread in self.threads:
+            thread.daemon=True
+            thread.start()
+
+    def run(self, dsn):
+        conn=connect(dsn)
+        try:
+            while True:
+                batch=self.queue.get()
+                if batch is None:
+                    return
+                if self.errors:
+                    continue
+                try:
+                    self.copy(conn, *batch)
+                except Exception as e:
+                    conn.rollback()
+                    self.errors.append(e)
+        finally:
+            conn.close()
+
+    def copy(self, conn, name, batch_no, end_offset, buffers):
+        with conn.cursor() as cursor:
+            for table, data in buffers.items():
+                cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+                                   % (stage_table(table), ', '.join(TABLES[table][0])), io.StringIO(data))
+            cursor.execute('INSERT INTO yelp_load_batches (name, batch_no, end_offset) VALUES (%s, %s, %s)',
+                           (name, batch_no, end_offset))
+        conn.commit()
+
+    def put(self, batch):
+        if self.errors:
+            raise self.errors[0]
+        self.queue.put(batch)
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+
+def prepare_dump(conn, name, tables, path, batch_size, force):
+    """
+    Return (status, {batch_no: end_offset}) for a dump, starting it over when
+    the file or the batch size changed since the last run.
+    """
+    with conn.cursor() as cursor:
+        for table in tables:
+            cursor.execute('CREATE UNLOGGED TABLE IF NOT EXISTS %s (LIKE %s)' % (stage_table(table), table))
+        cursor.execute('SELECT fingerprint, batch_size, status FROM yelp_load_files WHERE name=%s', (name,))
+        row=cursor.fetchone()
+        if row and row[0]==fingerprint(path) and row[1]==batch_size and not force:
+            cursor.execute('SELECT batch_no, end_offset FROM yelp_load_batches WHERE name=%s', (name,))
+            batches=dict(cursor.fetchall())
+            conn.commit()
+            return row[2], batches
+        cursor.execute('DELETE FROM yelp_load_batches WHERE name=%s', (name,))
+        cursor.execute('TRUNCATE %s' % ', '.join(stage_table(table) for table in tables))
+        cursor.execute('INSERT INTO yelp_load_files (name, fingerprint, batch_size, status) VALUES (%s, %s, %s, %s) '
+                       'ON CONFLICT (name) DO UPDATE SET fingerprint=EXCLUDED.fingerprint, '
+                       'batch_size=EXCLUDED.batch_size, status=EXCLUDED.status',
+                       (name, fingerprint(path), batch_size, 'staging'))
+    conn.commit()
+    return 'staging', {}
+
+
+def stage_dump(conn, dsn, name, path, transform, context, batches, batch_size, jobs):
+    """
+    Stream path into the staging tables; batches already in `batches` are skipped.
+    """
+    batch_no=0
+    offset=0
+    # resume after the last batch of the contiguous run of finished ones
+    while batch_no in batches:
+        offset=batches[batch_no]
+        batch_no+=1
+    workers=CopyWorkers(dsn, jobs)
+    lines=0
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                skip=batch_no in batches
+                rows={}
+                count=0
+                for line in f:
+                    offset+=len(line)
+                    count+=1
+                    if not skip and line.strip():
+                        for table, row in transform(json.loads(line), context):
+                            rows.setdefault(table, []).append(row)
+                    if count==batch_size:
+                        break
+                if count==0:
+                    break
+                lines+=count
+                if not skip:
+                    workers.put((name, batch_no, offset, dict((table, to_csv(r)) for table, r in rows.items())))
+                batch_no+=1
+    finally:
+        workers.close()
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE yelp_load_files SET status='staged' WHERE name=%s", (name,))
+    conn.commit()
+    return lines
+
+
+#
+# merging
+#
+def defer_indexes(cursor, table):
+    """
+    Drop the indexes of table that do not back a constraint, remembering
+    their definitions in yelp_load_indexes so an interrupted run restores them.
+    """
+    cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE schemaname=current_schema() AND tablename=%s '
+                   'AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid=%s::regclass)', (table, table))
+    for index, definition in cursor.fetchall():
+        cursor.execute('INSERT INTO yelp_load_indexes (name, tablename, definition) VALUES (%s, %s, %s) '
+                       'ON CONFLICT (name) DO NOTHING', (index, table, definition))
+        cursor.execute('DROP INDEX %s' % index)
+
+
+def restore_indexes(cursor, table=None):
+    if table is None:
+        cursor.execute('SELECT name, definition FROM yelp_load_indexes')
+    else:
+        cursor.execute('SELECT name, definition FROM yelp_load_indexes WHERE tablename=%s', (table,))
+    for index, definition in cursor.fetchall():
+        cursor.execute(definition)
+        cursor.execute('DELETE FROM yelp_load_indexes WHERE name=%s', (index,))
+
+
+def merge_sql(table):
+    columns, key, update, parents=TABLES[table]
+    conditions=[]
+    for parent, pairs in parents:
+        conditions.append('EXISTS (SELECT 1 FROM %s P WHERE %s)'
+                          % (parent, ' AND '.join('P.%s=S.%s' % (p, c) for c, p in pairs)))
+    if update:
+        conflict='DO UPDATE SET '+', '.join('%s=EXCLUDED.%s' % (c, c) for c in update)
+    else:
+        conflict='DO NOTHING'
+    return ('INSERT INTO %s (%s) SELECT DISTINCT ON (%s) %s FROM %s S %s ORDER BY %s ON CONFLICT (%s) %s'
+            % (table, ', '.join(columns), ', '.join('S.'+c for c in key), ', '.join('S.'+c for c in columns),
+               stage_table(table), 'WHERE '+' AND '.join(conditions) if conditions else '',
+               ', '.join('S.'+c for c in key), ', '.join(key), conflict))
+
+
+def merge_dump(conn, name, tables, defer):
+    """
+    Merge the staged rows of one dump into its tables, one transaction per table.
+    """
+    counts={}
+    for table in tables:
+        start=time.time()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM %s)' % table)
+            empty=cursor.fetchone()[0]
+            if defer=='always' or (defer=='auto' and empty):
+                defer_indexes(cursor, table)
+            rebuild=REBUILT_AFTER_MERGE.get(table)
+            if rebuild:
+                cursor.execute('ALTER TABLE %s DISABLE TRIGGER USER' % table)
+            cursor.execute(merge_sql(table))
+            counts[table]=cursor.rowcount
+            if rebuild:
+                cursor.execute('ALTER TABLE %s ENABLE TRIGGER USER' % table)
+                cursor.execute('SELECT to_regproc(%s) IS NOT NULL', (rebuild,))
+                if cursor.fetchone()[0]:
+                    cursor.execute('SELECT %s()' % rebuild)
+            restore_indexes(cursor, table)
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute('ANALYZE %s' % table)
+        conn.commit()
+        print('%s: merged %d rows into %s in %.1fs' % (name, counts[table], table, time.time()-start), file=sys.stderr)
+    with conn.cursor() as cursor:
+        for recount in sorted(set(RECOUNTED_AFTER_MERGE[table] for table in tables if table in RECOUNTED_AFTER_MERGE)):
+            cursor.execute('SELECT to_regproc(%s) IS NOT NULL', (recount,))
+            if cursor.fetchone()[0]:
+                start=time.time()
+                cursor.execute('SELECT %s()' % recount)
+                print('%s: %s() repaired %d rows in %.1fs' % (name, recount, cursor.fetchone()[0], time.time()-start),
+                      file=sys.stderr)
+        cursor.execute('TRUNCATE %s' % ', '.join(stage_table(table) for table in tables))
+        cursor.execute('DELETE FROM yelp_load_batches WHERE name=%s', (name,))
+        cursor.execute("UPDATE yelp_load_files SET status='merged' WHERE name=%s", (name,))
+    conn.commit()
+    return counts
+
+
+def load_rids(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT rid FROM restaurants')
+        return set(row[0] for row in cursor)
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', required=True, help='directory with the Yelp *.json dumps')
+    parser.add_argument('--database-uri', default=DATABASEURI, help='defaults to $DATABASEURI')
+    parser.add_argument('--only', nargs='+', choices=[name for name, _, _ in DUMPS], help='load only these dumps')
+    parser.add_argument('--jobs', type=int, default=4, help='parallel COPY connections')
+    parser.add_argument('--batch-size', type=int, default=20000, help='records per COPY batch')
+    parser.add_argument('--since', help='skip reviews and tips before this date (YYYY-MM-DD)')
+    parser.add_argument('--all-businesses', action='store_true', help='also load businesses that are not restaurants')
+    parser.add_argument('--defer-indexes', choices=['auto', 'always', 'never'], default='auto',
+                        help='drop and rebuild secondary indexes around a merge (auto: when the table is empty)')
+    parser.add_argument('--force', action='store_true', help='re-import dumps that were already merged')
+    args=parser.parse_args(argv)
+    if not args.database_uri:
+        parser.error('--database-uri or $DATABASEURI is required')
+
+    conn=connect(args.database_uri)
+    with conn.cursor() as cursor:
+        cursor.execute(PROGRESS_SQL)
+        # indexes left dropped by an interrupted merge
+        restore_indexes(cursor)
+    conn.commit()
+
+    context=argparse.Namespace(all_businesses=args.all_businesses, since=args.since, rids=None)
+    try:
+        for name, tables, transform in DUMPS:
+            if args.only and name not in args.only:
+                continue
+            path=find_dump(args.dataset, name)
+            if path is None:
+                print('%s: no dump found, skipped' % name, file=sys.stderr)
+                continue
+            status, batches=prepare_dump(conn, name, tables, path, args.batch_size, args.force)
+            if status=='merged':
+                print('%s: already merged, skipped (use --force to re-import)' % name, file=sys.stderr)
+                continue
+            if context.rids is None and name!='business':
+                context.rids=load_rids(conn)
+            if status=='staging':
+                start=time.time()
+                lines=stage_dump(conn, args.database_uri, name, path, transform, context, batches,
+                                 args.batch_size, args.jobs)
+                print('%s: staged %d records in %.1fs' % (name, lines, time.time()-start), file=sys.stderr)
+            merge_dump(conn, name, tables, args.defer_indexes)
+            if name=='business':
+                context.rids=load_rids(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
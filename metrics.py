@@ -0,0 +1,334 @@
+"""
+Prometheus text-format metrics for server.py, without a client library.
+
+Counters, gauges and histograms record into a per-thread shard, so the hot
+path is a dict update with no lock; collect() sums the shards (folding those
+of finished threads into one) when /metrics is scraped. Callback metrics are
+read at collect time instead (pool size, cache stats).
+
+With several worker processes each one periodically dumps its snapshot to
+METRICS_DIR/metrics-<pid>.json, and merge() adds them up. When a scrape finds
+the file of a process that has exited, it folds the counters and histograms
+into METRICS_DIR/archive.json and deletes the file (gauges of exited
+processes are dropped), so the directory does not grow with every recycled
+worker. clear() empties the directory when a server starts, so counts do not
+carry over between runs.
+"""
+
+import bisect, errno, fcntl, glob, json, os, threading, time
+
+ARCHIVE = 'archive.json'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric(object):
+
+    def __init__(self, registry, name, help, kind):
+        self.registry=registry
+        self.name=name
+        self.help=help
+        self.kind=kind
+
+
+class Counter(Metric):
+
+    def __init__(self, registry, name, help):
+        Metric.__init__(self, registry, name, help, 'counter')
+
+    def inc(self, amount=1, **labels):
+        shard=self.registry.shard()
+        key=(self.name, tuple(sorted(labels.items())))
+        shard[key]=shard.get(key, 0)+amount
+
+
+class Gauge(Counter):
+    """
+    A gauge that is only ever moved with inc()/dec(), so shards can be summed.
+    """
+
+    def __init__(self, registry, name, help):
+        Metric.__init__(self, registry, name, help, 'gauge')
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+
+    def __init__(self, registry, name, help, buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, registry, name, help, 'histogram')
+        self.buckets=tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard=self.registry.shard()
+        key=(self.name, tuple(sorted(labels.items())))
+        counts=shard.get(key)
+        if counts is None:
+            # one slot per bucket, one for +Inf, then the sum
+            counts=shard[key]=[0]*(len(self.buckets)+2)
+        counts[bisect.bisect_left(self.buckets, value)]+=1
+        counts[-1]+=value
+
+
+class Callback(Metric):
+    """
+    A counter or gauge whose values come from fn() -> {labels dict as tuple: value}.
+    """
+
+    def __init__(self, registry, name, help, kind, fn):
+        Metric.__init__(self, registry, name, help, kind)
+        self.fn=fn
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics=[]
+        self.local=threading.local()
+        self.shards=[]  # [(thread, shard)]
+        self.retired={}
+        self.lock=threading.Lock()
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self.add(Counter(self, name, help))
+
+    def gauge(self, name, help):
+        return self.add(Gauge(self, name, help))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(self, name, help, buckets))
+
+    def callback(self, name, help, kind, fn):
+        return self.add(Callback(self, name, help, kind, fn))
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard=self.local.shard={}
+            with self.lock:
+                self.shards.append((threading.current_thread(), shard))
+            return shard
+
+    def collect(self):
+        """
+        Snapshot of every metric: {'pid': ..., 'values': [[name, labels, value], ...]}.
+        """
+        values={}
+        with self.lock:
+            live=[]
+            for thread, shard in self.shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    add_values(self.retired, list(shard.items()))
+            self.shards=live
+            add_values(values, list(self.retired.items()))
+            for thread, shard in live:
+                add_values(values, list(shard.items()))
+        for metric in self.metrics:
+            if isinstance(metric, Callback):
+                for labels, value in metric.fn().items():
+                    values[(metric.name, tuple(sorted(labels)))]=value
+        return {'pid': os.getpid(), 'time': time.time(),
+                'values': [[name, labels, value] for (name, labels), value in values.items()]}
+
+    def dump(self, directory):
+        """
+        Write this process's snapshot to directory/metrics-<pid>.json.
+        """
+        write_snapshot(os.path.join(directory, 'metrics-%d.json' % os.getpid()), self.collect())
+
+    def merge(self, snapshots):
+        """
+        Add up snapshots from several processes; gauges only count live ones.
+        """
+        kinds=dict((metric.name, metric.kind) for metric in self.metrics)
+        values={}
+        for snapshot in snapshots:
+            alive=snapshot['pid'] is not None and pid_alive(snapshot['pid'])
+            items=[]
+            for name, labels, value in snapshot['values']:
+                if kinds.get(name)=='gauge' and not alive:
+                    continue
+                items.append(((name, tuple(tuple(label) for label in labels)), value))
+            add_values(values, items)
+        return values
+
+    def render(self, values):
+        """
+        Prometheus text exposition of merged values.
+        """
+        lines=[]
+        for metric in self.metrics:
+            series=sorted((labels, value) for (name, labels), value in values.items() if name==metric.name)
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for labels, value in series:
+                if metric.kind!='histogram':
+                    lines.append('%s%s %s' % (metric.name, format_labels(labels), format_value(value)))
+                    continue
+                cumulative=0
+                for bound, count in zip(metric.buckets+(float('inf'),), value[:-1]):
+                    cumulative+=count
+                    lines.append('%s_bucket%s %d' % (metric.name, format_labels(labels+(('le', format_value(bound)),)),
+                                                     cumulative))
+                lines.append('%s_sum%s %s' % (metric.name, format_labels(labels), format_value(value[-1])))
+                lines.append('%s_count%s %d' % (metric.name, format_labels(labels), cumulative))
+        return '\n'.join(lines)+'\n'
+
+    def exposition(self, directory=None):
+        """
+        Text for /metrics: this process, plus the other workers' dumps in directory.
+        """
+        snapshots=[self.collect()]
+        if directory:
+            snapshots+=self.gather(directory)
+        return self.render(self.merge(snapshots))
+
+    def gather(self, directory):
+        """
+        The archive and the snapshots of the other live processes in
+        directory; exited processes are folded into the archive first.
+        """
+        with open(os.path.join(directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                archive=read_snapshot(os.path.join(directory, ARCHIVE)) or {'pid': None, 'values': [], 'folded': []}
+                live=[]
+                exited=[]
+                for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                    snapshot=read_snapshot(path)
+                    if snapshot is None or snapshot['pid']==os.getpid():
+                        continue
+                    if pid_alive(snapshot['pid']):
+                        live.append(snapshot)
+                    else:
+                        exited.append((path, snapshot))
+                if exited:
+                    self.fold(directory, archive, exited)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return [archive]+live
+
+    def fold(self, directory, archive, exited):
+        """
+        Add exited processes' counters and histograms to the archive, then
+        delete their files. 'folded' remembers (pid, time) of files already
+        added, in case a crash left one behind after the archive was written.
+        """
+        kinds=dict((metric.name, metric.kind) for metric in self.metrics)
+        folded=set(tuple(entry) for entry in archive.get('folded', []))
+        values=dict(((name, tuple(tuple(label) for label in labels)), value)
+                    for name, labels, value in archive['values'])
+        for path, snapshot in exited:
+            if (snapshot['pid'], snapshot['time']) in folded:
+                continue
+            add_values(values, [((name, tuple(tuple(label) for label in labels)), value)
+                                for name, labels, value in snapshot['values'] if kinds.get(name)!='gauge'])
+            folded.add((snapshot['pid'], snapshot['time']))
+        archive['values']=[[name, labels, value] for (name, labels), value in values.items()]
+        archive['folded']=sorted(folded)
+        write_snapshot(os.path.join(directory, ARCHIVE), archive)
+        for path, snapshot in exited:
+            try:
+                os.remove(path)
+            except OSError as e:
+                if e.errno!=errno.ENOENT:
+                    raise
+        # the files are gone, so their markers are no longer needed
+        archive['folded']=[]
+        write_snapshot(os.path.join(directory, ARCHIVE), archive)
+
+
+class Dumper(object):
+    """
+    Dumps a registry to a directory every interval seconds from a daemon thread.
+    Threads do not survive fork(), so start() is called again in each worker.
+    """
+
+    def __init__(self, registry, directory, interval=5):
+        self.registry=registry
+        self.directory=directory
+        self.interval=interval
+        self.pid=None
+
+    def start(self):
+        if self.pid==os.getpid():
+            return
+        self.pid=os.getpid()
+        thread=threading.Thread(target=self.run)
+        thread.daemon=True
+        thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.registry.dump(self.directory)
+            except Exception:
+                import traceback; traceback.print_exc()
+
+
+def clear(directory):
+    """
+    Remove the snapshots and archive of an earlier run from directory.
+    """
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json*'))+[os.path.join(directory, ARCHIVE)]:
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno!=errno.ENOENT:
+                raise
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_snapshot(path, snapshot):
+    tmp='%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.rename(tmp, path)
+
+
+def add_values(values, items):
+    for key, value in items:
+        if isinstance(value, list):
+            current=values.get(key)
+            values[key]=[a+b for a, b in zip(current, value)] if current is not None else list(value)
+        else:
+            values[key]=values.get(key, 0)+value
+
+
+def pid_alive(pid):
+    if pid==os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for name, value in labels)
+
+
+def format_value(value):
+    if value==float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
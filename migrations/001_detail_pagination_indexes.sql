@@ -0,0 +1,10 @@
+-- Composite indexes backing the keyset pagination of tips and reviews on the
+-- restaurant detail page (see load_tips / load_reviews in server.py).
+--
+--     psql proj1part2 -f migrations/001_detail_pagination_indexes.sql
+
+CREATE INDEX IF NOT EXISTS reviews_rid_date_review_id_idx
+    ON reviews (rid, date DESC, review_id DESC);
+
+CREATE INDEX IF NOT EXISTS tip_writes_rid_t_date_tid_idx
+    ON tip_writes (rid, t_date DESC, tid DESC);
@@ -0,0 +1,27 @@
+-- Trigram indexes backing the fuzzy search form (search mode 'trgm' in
+-- server.py). ILIKE '%term%' on these columns becomes an index scan and
+-- similarity() ranks the matches.
+--
+--     psql proj1part2 -f migrations/002_fuzzy_search_trgm.sql
+--
+-- Without the extension the server falls back to its in-process trigram index
+-- (FUZZY_SEARCH_BACKEND=ngram).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS restaurants_r_name_trgm_idx
+    ON restaurants USING gin (r_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS categories_style_trgm_idx
+    ON categories USING gin (style gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS location_city_trgm_idx
+    ON location USING gin (city gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS location_state_trgm_idx
+    ON location USING gin (state gin_trgm_ops);
+
+-- the EXISTS semi-joins of the search query probe these by rid / address
+CREATE INDEX IF NOT EXISTS categories_rid_idx ON categories (rid);
+CREATE INDEX IF NOT EXISTS open_location_rid_idx ON open_location (rid);
+CREATE INDEX IF NOT EXISTS open_location_address_idx ON open_location (address, postal_code);
@@ -0,0 +1,14 @@
+-- Spatial index backing the nearest-restaurant search (GEO_BACKEND
+-- 'earthdistance' in server.py): earth_box() @> ll_to_earth(...) becomes a
+-- GiST index scan instead of a scan of the whole location table.
+--
+--     psql proj1part2 -f migrations/003_location_earthdistance.sql
+--
+-- Without the extensions the server answers the same query from an
+-- in-process KD-tree (GEO_BACKEND=kdtree).
+
+CREATE EXTENSION IF NOT EXISTS cube;
+CREATE EXTENSION IF NOT EXISTS earthdistance;
+
+CREATE INDEX IF NOT EXISTS location_earth_idx
+    ON location USING gist (ll_to_earth(latitude, longitude));
@@ -0,0 +1,30 @@
+-- Database-side id generation for users, reviews and tip_writes.
+--
+-- The ids are text columns (Yelp ids are 22-character strings); rows created
+-- by the app get numeric ids. Each sequence is seeded past the largest numeric
+-- id and the row count (what the old COUNT(*)+1 scheme could have produced),
+-- and becomes the column default so inserts use INSERT ... RETURNING.
+--
+--     psql proj1part2 -f migrations/004_id_sequences.sql
+
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS users_uid_seq OWNED BY users.uid;
+SELECT setval('users_uid_seq', GREATEST(
+    (SELECT COALESCE(MAX(uid::bigint), 0) FROM users WHERE uid ~ '^[0-9]{1,18}$'),
+    (SELECT COUNT(*) FROM users), 1));
+ALTER TABLE users ALTER COLUMN uid SET DEFAULT nextval('users_uid_seq')::text;
+
+CREATE SEQUENCE IF NOT EXISTS reviews_review_id_seq OWNED BY reviews.review_id;
+SELECT setval('reviews_review_id_seq', GREATEST(
+    (SELECT COALESCE(MAX(review_id::bigint), 0) FROM reviews WHERE review_id ~ '^[0-9]{1,18}$'),
+    (SELECT COUNT(*) FROM reviews), 1));
+ALTER TABLE reviews ALTER COLUMN review_id SET DEFAULT nextval('reviews_review_id_seq')::text;
+
+CREATE SEQUENCE IF NOT EXISTS tip_writes_tid_seq OWNED BY tip_writes.tid;
+SELECT setval('tip_writes_tid_seq', GREATEST(
+    (SELECT COALESCE(MAX(tid::bigint), 0) FROM tip_writes WHERE tid ~ '^[0-9]{1,18}$'),
+    (SELECT COUNT(*) FROM tip_writes), 1));
+ALTER TABLE tip_writes ALTER COLUMN tid SET DEFAULT nextval('tip_writes_tid_seq')::text;
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Indexes backing the friend activity feed (load_friend_feed in server.py):
+-- each friend's most recent reviews and tips are read with a short index
+-- scan instead of a scan of their whole history.
+--
+--     psql proj1part2 -f migrations/005_friend_feed_indexes.sql
+
+CREATE INDEX IF NOT EXISTS reviews_uid_date_review_id_idx
+    ON reviews (uid, date DESC, review_id DESC);
+
+CREATE INDEX IF NOT EXISTS tip_writes_uid_t_date_tid_idx
+    ON tip_writes (uid, t_date DESC, tid DESC);
+
+CREATE INDEX IF NOT EXISTS friends_uid_a_idx
+    ON friends (uid_a, uid_b);
@@ -0,0 +1,25 @@
+-- Per-user activity timelines for the fan-out-on-write friend feed
+-- (FEED_MODE=push in server.py). Each row is a compact reference to a
+-- review or tip written by one of uid's friends; the primary key doubles as
+-- the index the friend page reads newest-first.
+--
+--     psql proj1part2 -f migrations/006_timelines.sql
+--     FLASK_APP=server.py flask backfill-timelines
+
+CREATE TABLE IF NOT EXISTS timelines (
+    uid text NOT NULL,
+    date date NOT NULL,
+    kind text NOT NULL,          -- 'review' or 'tip'
+    item_id text NOT NULL,       -- review_id or tid
+    author_uid text NOT NULL,
+    rid text,
+    PRIMARY KEY (uid, date, kind, item_id)
+);
+
+-- unfriending removes one author's entries from a timeline
+CREATE INDEX IF NOT EXISTS timelines_uid_author_idx
+    ON timelines (uid, author_uid);
+
+-- fan-out looks up the followers of the author
+CREATE INDEX IF NOT EXISTS friends_uid_b_idx
+    ON friends (uid_b, uid_a);
@@ -0,0 +1,11 @@
+-- Indexes backing the bookmark list (load_bookmarks in server.py): one
+-- page of a user's bookmarks is a range scan on (uid, rid), and the
+-- thumbnail lookup reads a single has_photo entry per restaurant.
+--
+--     psql proj1part2 -f migrations/007_bookmarks_uid_index.sql
+
+CREATE INDEX IF NOT EXISTS bookmarks_uid_rid_idx
+    ON bookmarks (uid, rid);
+
+CREATE INDEX IF NOT EXISTS has_photo_rid_pid_idx
+    ON has_photo (rid, pid);
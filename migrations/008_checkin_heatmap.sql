@@ -0,0 +1,82 @@
+-- Precomputed checkin heatmap for the restaurant detail page. Each
+-- restaurant has one row holding its 7 x 24 checkin counts as a flat
+-- 168-element array (slot = weekday * 24 + hour, Monday = 0) plus the
+-- peak slot, so the page reads one row instead of pivoting raw checkins.
+--
+-- A trigger on checkin keeps the row up to date one slot at a time; this
+-- file fills the table once, and after a bulk load that bypassed the
+-- trigger everything can be rebuilt with:
+--
+--     psql proj1part2 -f migrations/008_checkin_heatmap.sql
+--     FLASK_APP=server.py flask rebuild-checkin-heatmap
+
+CREATE TABLE IF NOT EXISTS checkin_heatmap (
+    rid text PRIMARY KEY REFERENCES restaurants,
+    counts integer[] NOT NULL DEFAULT array_fill(0, ARRAY[168]),
+    peak_day smallint,           -- 0 = Monday
+    peak_hour smallint,
+    peak_count integer NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION checkin_slot(p_weekday text, p_hour time) RETURNS integer AS $$
+    SELECT (array_position(ARRAY['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], p_weekday) - 1) * 24
+           + EXTRACT(HOUR FROM p_hour)::integer;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- add delta checkins to one slot and recompute the peak from the array
+CREATE OR REPLACE FUNCTION checkin_heatmap_add(p_rid text, p_weekday text, p_hour time, p_delta integer) RETURNS void AS $$
+DECLARE
+    v_slot integer := checkin_slot(p_weekday, p_hour);
+BEGIN
+    IF v_slot IS NULL OR p_delta IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO checkin_heatmap (rid) VALUES (p_rid) ON CONFLICT (rid) DO NOTHING;
+    UPDATE checkin_heatmap SET counts[v_slot + 1] = counts[v_slot + 1] + p_delta WHERE rid = p_rid;
+    UPDATE checkin_heatmap H
+       SET peak_day = P.slot / 24, peak_hour = P.slot % 24, peak_count = P.n
+      FROM (SELECT c.i - 1 AS slot, c.n
+              FROM checkin_heatmap, unnest(counts) WITH ORDINALITY AS c(n, i)
+             WHERE rid = p_rid
+             ORDER BY c.n DESC, c.i
+             LIMIT 1) P
+     WHERE H.rid = p_rid;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION checkin_heatmap_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM checkin_heatmap_add(OLD.rid, OLD.weekday, OLD.hour, -OLD.counts);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM checkin_heatmap_add(NEW.rid, NEW.weekday, NEW.hour, NEW.counts);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS checkin_heatmap_sync ON checkin;
+CREATE TRIGGER checkin_heatmap_sync
+    AFTER INSERT OR UPDATE OR DELETE ON checkin
+    FOR EACH ROW EXECUTE PROCEDURE checkin_heatmap_sync();
+
+-- full recompute from the checkin table; returns the number of heatmaps
+CREATE OR REPLACE FUNCTION rebuild_checkin_heatmap() RETURNS bigint AS $$
+    DELETE FROM checkin_heatmap;
+    INSERT INTO checkin_heatmap (rid, counts, peak_day, peak_hour, peak_count)
+    SELECT G.rid, G.counts, P.slot / 24, P.slot % 24, P.n
+    FROM (SELECT S.rid, array_agg(COALESCE(C.n, 0) ORDER BY N.slot) AS counts
+            FROM (SELECT DISTINCT rid FROM checkin) S
+            CROSS JOIN generate_series(0, 167) N(slot)
+            LEFT JOIN (SELECT rid, checkin_slot(weekday, hour) AS slot, SUM(counts)::integer AS n
+                         FROM checkin GROUP BY 1, 2) C ON C.rid = S.rid AND C.slot = N.slot
+           GROUP BY S.rid) G,
+    LATERAL (SELECT c.i - 1 AS slot, c.n
+               FROM unnest(G.counts) WITH ORDINALITY AS c(n, i)
+              ORDER BY c.n DESC, c.i
+              LIMIT 1) P;
+    SELECT COUNT(*) FROM checkin_heatmap;
+$$ LANGUAGE sql;
+
+SELECT rebuild_checkin_heatmap();
@@ -0,0 +1,73 @@
+-- Per-restaurant counters kept next to the data they summarize, so pages
+-- and searches can show or sort by review counts and ratings without
+-- aggregating reviews at query time. The write routes in server.py update
+-- them in the same transaction as the row they insert or delete;
+-- reconcile_restaurant_stats() recomputes them and repairs any drift:
+--
+--     psql proj1part2 -f migrations/009_restaurant_stats.sql
+--     FLASK_APP=server.py flask reconcile-restaurant-stats
+
+CREATE TABLE IF NOT EXISTS restaurant_stats (
+    rid text PRIMARY KEY REFERENCES restaurants,
+    review_count integer NOT NULL DEFAULT 0,
+    rating_sum integer NOT NULL DEFAULT 0,
+    rating_1 integer NOT NULL DEFAULT 0,
+    rating_2 integer NOT NULL DEFAULT 0,
+    rating_3 integer NOT NULL DEFAULT 0,
+    rating_4 integer NOT NULL DEFAULT 0,
+    rating_5 integer NOT NULL DEFAULT 0,
+    useful integer NOT NULL DEFAULT 0,
+    funny integer NOT NULL DEFAULT 0,
+    cool integer NOT NULL DEFAULT 0,
+    tip_count integer NOT NULL DEFAULT 0,
+    bookmark_count integer NOT NULL DEFAULT 0
+);
+
+-- search sorted by popularity reads this index in order
+CREATE INDEX IF NOT EXISTS restaurant_stats_review_count_idx
+    ON restaurant_stats (review_count DESC, rid);
+
+-- recompute every counter; returns the number of rows that were wrong
+CREATE OR REPLACE FUNCTION reconcile_restaurant_stats() RETURNS bigint AS $$
+    WITH actual AS (
+        SELECT R.rid,
+               COALESCE(V.review_count, 0) AS review_count, COALESCE(V.rating_sum, 0) AS rating_sum,
+               COALESCE(V.rating_1, 0) AS rating_1, COALESCE(V.rating_2, 0) AS rating_2,
+               COALESCE(V.rating_3, 0) AS rating_3, COALESCE(V.rating_4, 0) AS rating_4,
+               COALESCE(V.rating_5, 0) AS rating_5, COALESCE(V.useful, 0) AS useful,
+               COALESCE(V.funny, 0) AS funny, COALESCE(V.cool, 0) AS cool,
+               COALESCE(T.tip_count, 0) AS tip_count, COALESCE(B.bookmark_count, 0) AS bookmark_count
+        FROM restaurants R
+        LEFT JOIN (SELECT rid, COUNT(*)::integer AS review_count, COALESCE(SUM(rating), 0)::integer AS rating_sum,
+                          COUNT(*) FILTER (WHERE rating=1)::integer AS rating_1,
+                          COUNT(*) FILTER (WHERE rating=2)::integer AS rating_2,
+                          COUNT(*) FILTER (WHERE rating=3)::integer AS rating_3,
+                          COUNT(*) FILTER (WHERE rating=4)::integer AS rating_4,
+                          COUNT(*) FILTER (WHERE rating=5)::integer AS rating_5,
+                          COALESCE(SUM(useful), 0)::integer AS useful, COALESCE(SUM(funny), 0)::integer AS funny,
+                          COALESCE(SUM(cool), 0)::integer AS cool
+                   FROM reviews GROUP BY rid) V ON V.rid=R.rid
+        LEFT JOIN (SELECT rid, COUNT(*)::integer AS tip_count FROM tip_writes GROUP BY rid) T ON T.rid=R.rid
+        LEFT JOIN (SELECT rid, COUNT(*)::integer AS bookmark_count FROM bookmarks GROUP BY rid) B ON B.rid=R.rid
+    ), repaired AS (
+        INSERT INTO restaurant_stats
+        SELECT A.* FROM actual A
+        LEFT JOIN restaurant_stats S ON S.rid=A.rid
+        WHERE S.rid IS NULL
+           OR (S.review_count, S.rating_sum, S.rating_1, S.rating_2, S.rating_3, S.rating_4, S.rating_5,
+               S.useful, S.funny, S.cool, S.tip_count, S.bookmark_count)
+              IS DISTINCT FROM
+              (A.review_count, A.rating_sum, A.rating_1, A.rating_2, A.rating_3, A.rating_4, A.rating_5,
+               A.useful, A.funny, A.cool, A.tip_count, A.bookmark_count)
+        ON CONFLICT (rid) DO UPDATE SET
+            review_count=EXCLUDED.review_count, rating_sum=EXCLUDED.rating_sum,
+            rating_1=EXCLUDED.rating_1, rating_2=EXCLUDED.rating_2, rating_3=EXCLUDED.rating_3,
+            rating_4=EXCLUDED.rating_4, rating_5=EXCLUDED.rating_5,
+            useful=EXCLUDED.useful, funny=EXCLUDED.funny, cool=EXCLUDED.cool,
+            tip_count=EXCLUDED.tip_count, bookmark_count=EXCLUDED.bookmark_count
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM repaired;
+$$ LANGUAGE sql;
+
+SELECT reconcile_restaurant_stats();
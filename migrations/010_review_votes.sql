@@ -0,0 +1,13 @@
+-- One row per (review, vote type, user) for the buffered review votes in
+-- server.py (VoteBuffer). A user's vote counts once; a flush that is
+-- replayed (e.g. from the local vote log after a crash) inserts nothing
+-- new and so adds nothing to the review counters.
+--
+--     psql proj1part2 -f migrations/010_review_votes.sql
+
+CREATE TABLE IF NOT EXISTS review_votes (
+    review_id text NOT NULL REFERENCES reviews ON DELETE CASCADE,
+    vote_type text NOT NULL CHECK (vote_type IN ('useful', 'funny', 'cool')),
+    uid text NOT NULL REFERENCES users ON DELETE CASCADE,
+    PRIMARY KEY (review_id, vote_type, uid)
+);
@@ -0,0 +1,80 @@
+-- Opening hours as minute-of-week ranges (Monday 00:00 = 0, one week =
+-- 10080 minutes) for the "open at" search filter in server.py. A span
+-- that closes after midnight runs into the next day, and Sunday night
+-- wraps around to Monday morning as a second range; open == close means
+-- open 24 hours. The GiST index answers "which restaurants contain
+-- minute m" without parsing open_hours per row.
+--
+-- A trigger on open_hours keeps a restaurant's ranges current:
+--
+--     psql proj1part2 -f migrations/011_open_intervals.sql
+
+CREATE TABLE IF NOT EXISTS open_intervals (
+    rid text NOT NULL REFERENCES restaurants ON DELETE CASCADE,
+    minutes int4range NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS open_intervals_minutes_idx
+    ON open_intervals USING gist (minutes);
+
+CREATE INDEX IF NOT EXISTS open_intervals_rid_idx
+    ON open_intervals (rid);
+
+CREATE OR REPLACE FUNCTION open_hours_intervals(p_day text, p_open time, p_close time) RETURNS SETOF int4range AS $$
+DECLARE
+    v_day integer := array_position(ARRAY['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], p_day) - 1;
+    v_open integer;
+    v_close integer;
+BEGIN
+    IF v_day IS NULL OR p_open IS NULL OR p_close IS NULL THEN
+        RETURN;
+    END IF;
+    v_open := v_day * 1440 + EXTRACT(HOUR FROM p_open)::integer * 60 + EXTRACT(MINUTE FROM p_open)::integer;
+    v_close := v_day * 1440 + EXTRACT(HOUR FROM p_close)::integer * 60 + EXTRACT(MINUTE FROM p_close)::integer;
+    IF v_close <= v_open THEN
+        v_close := v_close + 1440;
+    END IF;
+    IF v_close <= 10080 THEN
+        RETURN NEXT int4range(v_open, v_close);
+    ELSE
+        RETURN NEXT int4range(v_open, 10080);
+        RETURN NEXT int4range(0, v_close - 10080);
+    END IF;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_open_intervals(p_rid text) RETURNS void AS $$
+    DELETE FROM open_intervals WHERE rid = p_rid;
+    INSERT INTO open_intervals (rid, minutes)
+    SELECT H.rid, I.minutes
+    FROM open_hours H, open_hours_intervals(H.day, H.open, H.close) AS I(minutes)
+    WHERE H.rid = p_rid;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION open_intervals_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_open_intervals(OLD.rid);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.rid IS DISTINCT FROM OLD.rid) THEN
+        PERFORM refresh_open_intervals(NEW.rid);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS open_intervals_sync ON open_hours;
+CREATE TRIGGER open_intervals_sync
+    AFTER INSERT OR UPDATE OR DELETE ON open_hours
+    FOR EACH ROW EXECUTE PROCEDURE open_intervals_sync();
+
+-- full recompute from open_hours; returns the number of ranges
+CREATE OR REPLACE FUNCTION rebuild_open_intervals() RETURNS bigint AS $$
+    TRUNCATE open_intervals;
+    INSERT INTO open_intervals (rid, minutes)
+    SELECT H.rid, I.minutes
+    FROM open_hours H, open_hours_intervals(H.day, H.open, H.close) AS I(minutes);
+    SELECT COUNT(*) FROM open_intervals;
+$$ LANGUAGE sql;
+
+SELECT rebuild_open_intervals();
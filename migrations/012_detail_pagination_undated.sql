@@ -0,0 +1,16 @@
+-- Tips and reviews without a date sort after every dated one on the restaurant
+-- detail page. The pagination queries in server.py order by
+-- COALESCE(date, '-infinity'), so undated rows come last (as with NULLS LAST)
+-- while a keyset cursor is still one index range; these indexes replace those
+-- of migrations/001_detail_pagination_indexes.sql.
+--
+--     psql proj1part2 -f migrations/012_detail_pagination_undated.sql
+
+CREATE INDEX IF NOT EXISTS reviews_rid_undated_date_review_id_idx
+    ON reviews (rid, COALESCE(date, '-infinity'::date) DESC, review_id DESC);
+
+CREATE INDEX IF NOT EXISTS tip_writes_rid_undated_t_date_tid_idx
+    ON tip_writes (rid, COALESCE(t_date, '-infinity'::date) DESC, tid DESC);
+
+DROP INDEX IF EXISTS reviews_rid_date_review_id_idx;
+DROP INDEX IF EXISTS tip_writes_rid_t_date_tid_idx;
@@ -0,0 +1,16 @@
+-- The friend activity feed (load_friend_feed in server.py) orders each
+-- friend's reviews and tips by COALESCE(date, '-infinity'), so undated ones
+-- sort last and a feed cursor can point into them. These indexes keep that a
+-- short index scan and replace the date indexes of
+-- migrations/005_friend_feed_indexes.sql.
+--
+--     psql proj1part2 -f migrations/013_friend_feed_undated.sql
+
+CREATE INDEX IF NOT EXISTS reviews_uid_undated_date_review_id_idx
+    ON reviews (uid, COALESCE(date, '-infinity'::date) DESC, review_id DESC);
+
+CREATE INDEX IF NOT EXISTS tip_writes_uid_undated_t_date_tid_idx
+    ON tip_writes (uid, COALESCE(t_date, '-infinity'::date) DESC, tid DESC);
+
+DROP INDEX IF EXISTS reviews_uid_date_review_id_idx;
+DROP INDEX IF EXISTS tip_writes_uid_t_date_tid_idx;
@@ -0,0 +1,105 @@
+"""
+Photo files for server.py: originals stored as <directory>/<pid>.jpg, and
+size-bounded JPEG thumbnails generated once into a content-addressed cache.
+
+A thumbnail is stored as <cache>/<digest[:2]>/<digest>-<width>.jpg, where
+digest is the SHA-1 of the original's bytes. A replaced photo therefore gets
+new thumbnails, and identical photos share theirs. Digests are remembered
+per (path, size, mtime), so a file is only hashed again when it changes.
+
+Thumbnails need Pillow; without it thumbnail() returns None and the caller
+serves the original.
+"""
+
+import hashlib, os, re, threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class PhotoStore(object):
+
+    def __init__(self, directory, cache_directory, widths=(160, 320, 640), quality=82, memo_size=10000):
+        self.directory=directory
+        self.cache_directory=cache_directory
+        self.widths=tuple(widths)
+        self.quality=quality
+        self.memo_size=memo_size
+        self.digests=OrderedDict()  # path -> (size, mtime, digest)
+        self.lock=threading.Lock()
+        self.rendering={}  # thumbnail path -> lock, so one thread renders it
+
+    def original(self, pid):
+        """
+        Path of pid's original, or None for an unknown or malformed pid.
+        """
+        if not PID_PATTERN.match(pid or ''):
+            return None
+        path=os.path.join(self.directory, pid+'.jpg')
+        return path if os.path.isfile(path) else None
+
+    def digest(self, path):
+        """
+        Return (sha1 hex digest, os.stat result) of a file.
+        """
+        stat=os.stat(path)
+        with self.lock:
+            memo=self.digests.get(path)
+            if memo is not None and memo[:2]==(stat.st_size, stat.st_mtime):
+                self.digests.move_to_end(path)
+                return memo[2], stat
+        sha1=hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                sha1.update(block)
+        digest=sha1.hexdigest()
+        with self.lock:
+            self.digests[path]=(stat.st_size, stat.st_mtime, digest)
+            while len(self.digests)>self.memo_size:
+                self.digests.popitem(last=False)
+        return digest, stat
+
+    def thumbnail(self, path, width):
+        """
+        Return (thumbnail path, original digest, original stat) for an original
+        at path, rendering the thumbnail on first use; None without Pillow.
+        """
+        if Image is None or width not in self.widths:
+            return None
+        digest, stat=self.digest(path)
+        target=os.path.join(self.cache_directory, digest[:2], '%s-%d.jpg' % (digest, width))
+        if not os.path.exists(target):
+            with self.lock:
+                lock=self.rendering.setdefault(target, threading.Lock())
+            with lock:
+                if not os.path.exists(target):
+                    self.render(path, target, width)
+            with self.lock:
+                self.rendering.pop(target, None)
+        return target, digest, stat
+
+    def render(self, source, target, width):
+        """
+        Write a JPEG of source scaled to fit width x width. Other processes
+        may render the same file; the rename makes the last one win cleanly.
+        """
+        image=Image.open(source)
+        # lets the JPEG decoder skip most of the pixels of a large original
+        image.draft('RGB', (width, width))
+        image=image.convert('RGB')
+        image.thumbnail((width, width), Image.LANCZOS if hasattr(Image, 'LANCZOS') else Image.ANTIALIAS)
+        directory=os.path.dirname(target)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        tmp='%s.%d.%d.tmp' % (target, os.getpid(), threading.current_thread().ident)
+        image.save(tmp, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+        os.rename(tmp, target)
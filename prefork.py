@@ -0,0 +1,233 @@
+"""
+Pre-fork WSGI server for running server.py with several worker processes.
+
+The master binds one listening socket and forks `workers` processes that all
+accept() on it, replacing any worker that exits. Worker classes:
+
+    sync     one request at a time (werkzeug's BaseWSGIServer)
+    gthread  a thread per request (werkzeug's ThreadedWSGIServer)
+    gevent   a greenlet per request (gevent.pywsgi); the standard library
+             must already be monkey patched when the app is imported
+
+SIGTERM or SIGINT stops the master gracefully: workers stop accepting, finish
+the requests they have and exit, and whatever is still running after
+graceful_timeout seconds is killed. SIGHUP replaces every worker the same way.
+With max_requests set a worker exits after serving about that many requests
+(plus up to 10% jitter, so workers do not all restart at once) and the master
+forks a fresh one.
+
+post_fork() runs in each worker before it serves (e.g. to create its database
+engine) and worker_exit() when it stops.
+"""
+
+import errno, os, random, signal, socket, sys, threading, time
+
+WORKER_CLASSES = ['sync', 'gthread', 'gevent']
+
+
+class RequestCounter(object):
+    """
+    WSGI middleware counting requests served and requests still open; a
+    request stays open until its response body is closed.
+    """
+
+    def __init__(self, app):
+        self.app=app
+        self.served=0
+        self.active=0
+        self.lock=threading.Lock()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+        with self.lock:
+            self.served+=1
+            self.active+=1
+        try:
+            body=self.app(environ, start_response)
+        except:
+            self.done()
+            raise
+        return ClosingIterator(body, self.done)
+
+    def done(self):
+        with self.lock:
+            self.active-=1
+
+
+class Worker(object):
+
+    def __init__(self, app, sock, worker_class, max_requests, graceful_timeout, post_fork=None, worker_exit=None):
+        self.app=RequestCounter(app)
+        self.sock=sock
+        self.worker_class=worker_class
+        self.max_requests=max_requests+random.randint(0, max_requests//10) if max_requests else 0
+        self.graceful_timeout=graceful_timeout
+        self.post_fork=post_fork
+        self.worker_exit=worker_exit
+        self.alive=True
+
+    def stop(self, signum, frame):
+        self.alive=False
+
+    def serving(self):
+        return self.alive and not (self.max_requests and self.app.served>=self.max_requests)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        if self.post_fork is not None:
+            self.post_fork()
+        try:
+            if self.worker_class=='gevent':
+                self.run_gevent()
+            else:
+                self.run_werkzeug()
+        finally:
+            if self.worker_exit is not None:
+                self.worker_exit()
+
+    def run_werkzeug(self):
+        from werkzeug.serving import BaseWSGIServer, ThreadedWSGIServer
+        base=ThreadedWSGIServer if self.worker_class=='gthread' else BaseWSGIServer
+        worker=self
+
+        class Server(base):
+            # counts connections from accept() to close, which covers gthread
+            # requests whose thread has not reached the app yet
+            def process_request(self, request, client_address):
+                with worker.app.lock:
+                    worker.connections+=1
+                base.process_request(self, request, client_address)
+
+            def shutdown_request(self, request):
+                try:
+                    base.shutdown_request(self, request)
+                finally:
+                    with worker.app.lock:
+                        worker.connections-=1
+
+        self.connections=0
+        host, port=self.sock.getsockname()[:2]
+        server=Server(host, port, self.app, fd=self.sock.fileno())
+        server.timeout=0.5
+        while self.serving():
+            server.handle_request()
+        deadline=time.time()+self.graceful_timeout
+        while self.connections and time.time()<deadline:
+            time.sleep(0.1)
+        server.socket.close()
+
+    def run_gevent(self):
+        import gevent
+        from gevent.pywsgi import WSGIServer
+        server=WSGIServer(self.sock, self.app, log=None)
+        server.start()
+        while self.serving():
+            gevent.sleep(0.5)
+        server.stop(timeout=self.graceful_timeout)
+
+
+class Master(object):
+
+    def __init__(self, app, host, port, workers=2, worker_class='sync', max_requests=0, graceful_timeout=30,
+                 backlog=2048, post_fork=None, worker_exit=None):
+        if worker_class not in WORKER_CLASSES:
+            raise ValueError('unknown worker class: %s' % worker_class)
+        self.app=app
+        self.host=host
+        self.port=port
+        self.workers=workers
+        self.worker_class=worker_class
+        self.max_requests=max_requests
+        self.graceful_timeout=graceful_timeout
+        self.backlog=backlog
+        self.post_fork=post_fork
+        self.worker_exit=worker_exit
+        self.pids={}  # pid -> started at
+        self.stopping=False
+        self.reloading=False
+
+    def listen(self):
+        sock=socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        return sock
+
+    def run(self):
+        self.sock=self.listen()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        print("master %d serving on %s:%d with %d %s workers" % (os.getpid(), self.host, self.port, self.workers,
+                                                                 self.worker_class))
+        try:
+            while not self.stopping:
+                if self.reloading:
+                    self.reloading=False
+                    self.signal_workers(signal.SIGTERM)
+                self.reap()
+                while len(self.pids)<self.workers and not self.stopping:
+                    self.spawn()
+                time.sleep(0.5)
+        finally:
+            self.shutdown()
+
+    def stop(self, signum, frame):
+        self.stopping=True
+
+    def reload(self, signum, frame):
+        self.reloading=True
+
+    def spawn(self):
+        pid=os.fork()
+        if pid:
+            self.pids[pid]=time.time()
+            return
+        status=0
+        try:
+            Worker(self.app, self.sock, self.worker_class, self.max_requests, self.graceful_timeout,
+                   self.post_fork, self.worker_exit).run()
+        except:
+            import traceback; traceback.print_exc()
+            status=1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def reap(self):
+        while self.pids:
+            try:
+                pid, status=os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno!=errno.ECHILD:
+                    raise
+                self.pids.clear()
+                return
+            if not pid:
+                return
+            started=self.pids.pop(pid, None)
+            # a worker dying right after start (e.g. no database) should not
+            # make the master fork in a tight loop
+            if started is not None and status and time.time()-started<1:
+                time.sleep(1)
+
+    def signal_workers(self, signum):
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                self.pids.pop(pid, None)
+
+    def shutdown(self):
+        self.signal_workers(signal.SIGTERM)
+        deadline=time.time()+self.graceful_timeout
+        while self.pids and time.time()<deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.signal_workers(signal.SIGKILL)
+        self.reap()
+        self.sock.close()
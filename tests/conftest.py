@@ -0,0 +1,44 @@
+"""
+Shared fixtures. Tests that need the app run it in-process against the
+throw-away Postgres cluster and synthetic dataset used by bench/bench.py;
+they are skipped when PostgreSQL, psycopg2, SQLAlchemy or Flask is missing.
+"""
+
+import os, sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bench'))
+
+
+@pytest.fixture(scope='session')
+def database_uri():
+    pytest.importorskip('psycopg2')
+    import bench, dataset
+    try:
+        bench.find_pg_bin('initdb')
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    fixture=bench.LocalPostgres()
+    uri=fixture.start()
+    try:
+        bench.setup_database(uri, dataset.Scale(0.05))
+        yield uri
+    finally:
+        fixture.stop()
+
+
+@pytest.fixture(scope='session')
+def server(database_uri):
+    pytest.importorskip('sqlalchemy')
+    pytest.importorskip('flask')
+    os.environ['DATABASEURI']=database_uri
+    # every detail request goes to the database
+    os.environ['DETAIL_CACHE_URL']='local://?size=0'
+    os.environ['DETAIL_QUERIES']='sync'
+    import server
+    server.app.secret_key=os.urandom(12)
+    server.app.testing=True
+    return server
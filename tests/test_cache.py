@@ -0,0 +1,165 @@
+"""
+LocalCache eviction and expiry, RedisCache against an in-memory client, and
+make_cache URL parsing.
+"""
+
+import pytest
+
+import cache
+from cache import LocalCache, RedisCache, NullCache, make_cache
+
+
+class Clock(object):
+
+    def __init__(self, now=1000.0):
+        self.now=now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    return clock
+
+
+class FakeRedis(object):
+    """
+    The part of redis-py's client that RedisCache uses.
+    """
+
+    def __init__(self):
+        self.data={}
+
+    def get(self, key):
+        return self.data.get(key, (None, None))[1]
+
+    def setex(self, key, ttl, value):
+        self.data[key]=(ttl, value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def test_local_cache_evicts_least_recently_used():
+    c=LocalCache(size=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a')==1  # b is now the least recently used
+    c.set('c', 3)
+    assert len(c)==2
+    assert c.get('b') is None
+    assert c.get('a')==1
+    assert c.get('c')==3
+    assert c.stats.evictions==1
+
+
+def test_local_cache_set_refreshes_recency():
+    c=LocalCache(size=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    c.set('a', 10)
+    c.set('c', 3)
+    assert c.get('a')==10
+    assert c.get('b') is None
+
+
+def test_local_cache_size_zero_keeps_nothing():
+    c=LocalCache(size=0)
+    c.set('a', 1)
+    assert c.get('a') is None
+    assert len(c)==0
+
+
+def test_local_cache_entries_expire_after_ttl(clock):
+    c=LocalCache(ttl=10)
+    c.set('a', 1)
+    clock.now+=10
+    assert c.get('a')==1
+    clock.now+=0.5
+    assert c.get('a') is None
+    # the expired entry is dropped, not just hidden
+    assert len(c)==0
+    assert c.stats.hits==1 and c.stats.misses==1
+
+
+def test_local_cache_set_restarts_ttl(clock):
+    c=LocalCache(ttl=10)
+    c.set('a', 1)
+    clock.now+=8
+    c.set('a', 2)
+    clock.now+=8
+    assert c.get('a')==2
+
+
+def test_local_cache_delete_invalidates():
+    c=LocalCache()
+    c.set('a', 1)
+    c.set('b', 2)
+    c.delete('a', 'missing')
+    assert c.get('a') is None
+    assert c.get('b')==2
+    assert c.stats.deletes==1
+
+
+def test_local_cache_stats():
+    c=LocalCache()
+    c.set('a', 1)
+    c.get('a')
+    c.get('a')
+    c.get('b')
+    stats=c.stats.as_dict()
+    assert (stats['sets'], stats['hits'], stats['misses'])==(1, 2, 1)
+    assert stats['hit_ratio']==pytest.approx(2.0/3)
+
+
+def test_redis_cache_round_trip_and_delete():
+    client=FakeRedis()
+    c=RedisCache(client, ttl=30, prefix='t:')
+    c.set('a', {'rid': 'x', 'stars': 4.5})
+    assert client.data['t:a'][0]==30
+    assert c.get('a')=={'rid': 'x', 'stars': 4.5}
+    c.delete('a')
+    assert c.get('a') is None
+    assert c.stats.as_dict()['hits']==1
+    assert c.stats.as_dict()['misses']==1
+
+
+def test_null_cache_always_misses():
+    c=NullCache()
+    c.set('a', 1)
+    assert c.get('a') is None
+    c.delete('a')
+    assert len(c)==0
+    assert c.stats.misses==1
+
+
+def test_make_cache_local():
+    c=make_cache('local://?size=5&ttl=7')
+    assert isinstance(c, LocalCache)
+    assert (c.size, c.ttl)==(5, 7)
+
+
+def test_make_cache_local_defaults():
+    c=make_cache('local://')
+    assert (c.size, c.ttl)==(1000, 300)
+
+
+def test_make_cache_none():
+    assert isinstance(make_cache('none://'), NullCache)
+
+
+def test_make_cache_redis():
+    pytest.importorskip('redis')
+    c=make_cache('redis://localhost:6379/3?ttl=60')
+    assert isinstance(c, RedisCache)
+    assert c.ttl==60
+    assert c.client.connection_pool.connection_kwargs['db']==3
+
+
+def test_make_cache_unknown_scheme():
+    with pytest.raises(ValueError):
+        make_cache('memcached://localhost')
@@ -0,0 +1,73 @@
+"""
+show_restaurant_details issues a fixed number of statements, however many
+tips and reviews the restaurant has (no N+1 over the rows).
+"""
+
+import threading
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+
+class StatementCounter(object):
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.engine=engine
+        self.count=0
+        self.thread=threading.current_thread()
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread() is self.thread:
+            self.count+=1
+
+    def remove(self):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self.before_cursor_execute)
+
+
+@pytest.fixture(scope='module')
+def restaurants(database_uri):
+    """
+    rids with the fewest and the most reviews+tips, all having at least one of each.
+    """
+    conn=psycopg2.connect(database_uri)
+    try:
+        cursor=conn.cursor()
+        cursor.execute("""
+            SELECT R.rid, COUNT(DISTINCT V.review_id)+COUNT(DISTINCT T.tid) AS n
+            FROM restaurants R JOIN reviews V ON V.rid=R.rid JOIN tip_writes T ON T.rid=R.rid
+            GROUP BY R.rid ORDER BY n, R.rid""")
+        rows=cursor.fetchall()
+    finally:
+        conn.close()
+    assert rows[-1][1]>rows[0][1]
+    return [rows[0][0], rows[len(rows)//2][0], rows[-1][0]]
+
+
+def count_detail_statements(server, client, rid):
+    counter=StatementCounter(server.engine)
+    try:
+        response=client.get('/show_restaurant_details?rid=%s' % rid)
+        assert response.status_code==200
+    finally:
+        counter.remove()
+    return counter.count
+
+
+def test_guest_detail_query_count_is_fixed(server, restaurants):
+    client=server.app.test_client()
+    counts=[count_detail_statements(server, client, rid) for rid in restaurants]
+    # restaurant row, tips page, reviews page
+    assert counts==[3, 3, 3]
+
+
+def test_logged_in_detail_query_count_is_fixed(server, restaurants):
+    client=server.app.test_client()
+    response=client.post('/login_act', data={'account': 'user1', 'password': 'pw'})
+    assert response.status_code==302
+    counts=[count_detail_statements(server, client, rid) for rid in restaurants]
+    # plus the bookmark flag and one friends lookup for all tip/review authors
+    assert counts==[5, 5, 5]
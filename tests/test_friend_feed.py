@@ -0,0 +1,121 @@
+"""
+Paging through the friend activity feed returns every review and tip of the
+user's friends once, newest first, with undated ones last.
+"""
+
+import datetime
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+PAGE_SIZE = 7
+
+
+@pytest.fixture
+def undated(database_uri):
+    """
+    (uid, friend uid, rid, tids): three undated tips and an undated review by
+    one of uid's friends, removed again afterwards.
+    """
+    conn=psycopg2.connect(database_uri)
+    conn.autocommit=True
+    cursor=conn.cursor()
+    cursor.execute("SELECT uid_a, uid_b FROM friends ORDER BY uid_a, uid_b LIMIT 1")
+    uid, friend_uid=cursor.fetchone()
+    cursor.execute("SELECT rid FROM restaurants ORDER BY rid LIMIT 1")
+    rid=cursor.fetchone()[0]
+    tids=[]
+    for i in range(3):
+        cursor.execute("INSERT INTO tip_writes(uid, rid, t_text, t_date) VALUES (%s, %s, %s, NULL) RETURNING tid",
+                       (friend_uid, rid, 'undated tip %d' % i))
+        tids.append(cursor.fetchone()[0])
+    cursor.execute("""INSERT INTO reviews(rating, plaintext, useful, funny, cool, date, uid, rid)
+                      VALUES (3, 'undated review', 0, 0, 0, NULL, %s, %s) RETURNING review_id""", (friend_uid, rid))
+    review_id=cursor.fetchone()[0]
+    try:
+        yield uid, friend_uid, rid, tids
+    finally:
+        cursor.execute("DELETE FROM timelines WHERE item_id IN %s", (tuple(str(tid) for tid in tids)+(str(review_id),),))
+        cursor.execute("DELETE FROM tip_writes WHERE tid IN %s", (tuple(tids),))
+        cursor.execute("DELETE FROM reviews WHERE review_id=%s", (review_id,))
+        conn.close()
+
+
+def expected_feed(conn, uid):
+    """
+    Every (kind, item_id, date) of uid's friends, newest first, undated last.
+    """
+    cursor=conn.execute("""
+        SELECT 'review' AS kind, R.review_id AS item_id, R.date FROM friends F JOIN reviews R ON R.uid=F.uid_b
+        WHERE F.uid_a=%(uid)s
+        UNION ALL
+        SELECT 'tip', T.tid, T.t_date FROM friends F JOIN tip_writes T ON T.uid=F.uid_b
+        WHERE F.uid_a=%(uid)s""", {'uid': uid})
+    rows=[(row['kind'], str(row['item_id']), row['date']) for row in cursor]
+    cursor.close()
+    rows.sort(key=lambda row: (row[2] or datetime.date.min, row[0], row[1]), reverse=True)
+    return rows
+
+
+def paged_feed(server, conn, uid):
+    items=[]
+    cursor=None
+    while True:
+        activities, cursor=server.load_friend_feed(conn, uid, cursor, PAGE_SIZE)
+        items+=[(a['kind'], str(a['item_id']), a['date']) for a in activities]
+        if cursor is None:
+            return items
+
+
+def test_pull_feed_pages_through_undated_activity(server, undated):
+    uid=undated[0]
+    conn=server.engine.connect()
+    try:
+        expected=expected_feed(conn, uid)
+        assert expected[-1][2] is None
+        assert len(expected)>PAGE_SIZE
+        assert paged_feed(server, conn, uid)==expected
+    finally:
+        conn.close()
+
+
+def test_friend_activity_accepts_undated_cursor(server, undated):
+    uid=undated[0]
+    client=server.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in']=True
+        session['uid']=uid
+        session['u_name']='test'
+    conn=server.engine.connect()
+    try:
+        expected=expected_feed(conn, uid)
+    finally:
+        conn.close()
+    # a cursor on the first undated item, as the page before it would end
+    first=[item for item in expected if item[2] is None][0]
+    cursor=server.encode_cursor(server.UNDATED, first[0], first[1])
+    response=client.get('/friend_activity', query_string={'cursor': cursor, 'page_size': PAGE_SIZE})
+    assert response.status_code==200
+    assert response.get_json()['next_cursor'] is None
+
+
+def test_push_feed_stores_undated_activity(server, undated, monkeypatch):
+    uid, friend_uid, rid, tids=undated
+    monkeypatch.setattr(server, 'FEED_MODE', 'push')
+    conn=server.engine.connect()
+    try:
+        expected=expected_feed(conn, uid)
+        server.backfill_timelines(conn, cap=len(expected))
+        assert paged_feed(server, conn, uid)==expected
+
+        server.unfollow_timeline(conn, uid, friend_uid)
+        server.follow_timeline(conn, uid, friend_uid)
+        assert paged_feed(server, conn, uid)==expected
+
+        conn.execute("DELETE FROM timelines WHERE uid=%(uid)s AND kind='tip' AND item_id=%(tid)s",
+                     {'uid': uid, 'tid': str(tids[0])})
+        server.fan_out_activity(conn, 'tip', tids[0], None, friend_uid, rid)
+        assert paged_feed(server, conn, uid)==expected
+    finally:
+        conn.close()
@@ -0,0 +1,211 @@
+"""
+The in-process indexes against brute force over random data.
+"""
+
+import random
+
+import pytest
+
+from indexes import NgramIndex, KDTree, IntervalTree, PrefixIndex, WORD_RE, trigrams, similarity, haversine_km
+
+# few letters, so values share words and substrings
+LETTERS = 'abcdeAB'
+
+
+def random_word(rng):
+    return ''.join(rng.choice(LETTERS) for _ in range(rng.randint(1, 6)))
+
+
+def random_value(rng):
+    return rng.choice([' ', ' ', ', ', "'s ", '-']).join(random_word(rng) for _ in range(rng.randint(1, 3)))
+
+
+def linear_search(pairs, term):
+    scores={}
+    for value, key in pairs:
+        if term.lower() in value.lower():
+            score=similarity(trigrams(value), trigrams(term))
+            scores[key]=max(score, scores.get(key, -1.0))
+    return scores
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_ngram_search_matches_substring_scan(seed):
+    rng=random.Random(seed)
+    index=NgramIndex()
+    pairs=[]
+    values=[random_value(rng) for _ in range(rng.randint(1, 60))]
+    for _ in range(rng.randint(0, 200)):
+        # keys with several values, and values shared by several keys
+        key=rng.randint(0, 80)
+        value=rng.choice(values)
+        index.add(value, key)
+        pairs.append((value, key))
+    index.add(None, 'ignored')
+    assert len(index)==len(set(value for value, _ in pairs))
+    terms=['', ' ', "'", 'zz']+[random_word(rng) for _ in range(30)]
+    for value in values:
+        start=rng.randint(0, len(value))
+        # substrings of values, including ones spanning words
+        terms.append(value[start:start+rng.randint(1, 8)].swapcase())
+    for term in terms:
+        assert index.search(term)==linear_search(pairs, term), term
+
+
+def test_ngram_search_empty_index():
+    index=NgramIndex()
+    assert len(index)==0
+    assert index.search('abc')=={}
+    assert index.search('')=={}
+
+
+def linear_nearest(points, latitude, longitude, k, radius_km=None, predicate=None):
+    found=[]
+    for lat, lon, payload in points:
+        if lat is None or lon is None or (predicate is not None and not predicate(payload)):
+            continue
+        distance=haversine_km(latitude, longitude, lat, lon)
+        if radius_km is None or distance<=radius_km:
+            found.append(distance)
+    return sorted(found)[:k]
+
+
+def random_points(rng, n):
+    points=[]
+    for payload in range(n):
+        if points and rng.random()<0.1:
+            # the same place twice
+            lat, lon, _=rng.choice(points)
+        else:
+            lat, lon=rng.uniform(40.5, 41.0), rng.uniform(-74.3, -73.7)
+        points.append((lat, lon, payload))
+    points.append((None, -73.9, 'no location'))
+    return points
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_kdtree_nearest_matches_sorted_distances(seed):
+    rng=random.Random(seed)
+    points=random_points(rng, rng.randint(0, 300))
+    tree=KDTree(points)
+    assert len(tree)==len(points)-1
+    for _ in range(30):
+        latitude, longitude=rng.uniform(40.4, 41.1), rng.uniform(-74.4, -73.6)
+        k=rng.choice([1, 5, 20, len(points)+5])
+        radius_km=rng.choice([None, 2.0, 10.0])
+        predicate=rng.choice([None, lambda payload: payload%3==0])
+        results=tree.nearest(latitude, longitude, k, radius_km, predicate)
+        expected=linear_nearest(points, latitude, longitude, k, radius_km, predicate)
+        assert [r[0] for r in results]==pytest.approx(expected, abs=1e-6)
+        for distance, lat, lon, payload in results:
+            assert (lat, lon, payload) in points
+            assert distance==pytest.approx(haversine_km(latitude, longitude, lat, lon))
+
+
+def test_kdtree_nearest_across_the_globe():
+    # poles and the antimeridian, where latitude/longitude boxes would go wrong
+    rng=random.Random(42)
+    points=[(rng.uniform(-90, 90), rng.uniform(-180, 180), payload) for payload in range(500)]
+    points+=[(90.0, 0.0, 'north'), (-90.0, 0.0, 'south'), (0.0, 179.9, 'east'), (0.0, -179.9, 'west')]
+    tree=KDTree(points)
+    queries=[(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(50)]+[(89.9, 120.0), (0.0, -180.0)]
+    for latitude, longitude in queries:
+        results=tree.nearest(latitude, longitude, 7)
+        assert [r[0] for r in results]==pytest.approx(linear_nearest(points, latitude, longitude, 7), abs=1e-6)
+
+
+def test_kdtree_duplicate_points():
+    tree=KDTree([(40.8, -73.9, payload) for payload in range(5)]+[(40.9, -73.9, 'far')])
+    results=tree.nearest(40.8, -73.9, 5)
+    assert sorted(r[3] for r in results)==[0, 1, 2, 3, 4]
+    assert all(r[0]==pytest.approx(0.0) for r in results)
+    assert [r[3] for r in tree.nearest(40.8, -73.9, 10)][-1]=='far'
+
+
+def test_kdtree_empty_and_k_zero():
+    assert KDTree([]).nearest(40.8, -73.9, 5)==[]
+    assert len(KDTree([(None, None, 'x')]))==0
+    assert KDTree([(40.8, -73.9, 'x')]).nearest(40.8, -73.9, 0)==[]
+
+
+def linear_prefix(weights, prefix, limit):
+    prefix=prefix.strip().lower()
+    if not prefix or limit<=0:
+        return []
+    matches=[]
+    for value, weight in weights.items():
+        lower=value.lower()
+        if any(lower[match.start():].startswith(prefix) for match in WORD_RE.finditer(lower)):
+            matches.append((-weight, len(value), value))
+    return [(value, -weight) for weight, _, value in sorted(matches)[:limit]]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_prefix_search_matches_startswith_scan(seed):
+    rng=random.Random(seed)
+    weights={}
+    for _ in range(rng.randint(0, 150)):
+        # few distinct weights, so ties are broken by length and value
+        weights[random_value(rng)]=rng.randint(0, 5)
+    weights['']=100
+    index=PrefixIndex(weights, limit=10)
+    prefixes=['', '  ', 'zz']+[random_word(rng)[:rng.randint(1, 3)] for _ in range(40)]
+    for value in list(weights)[:40]:
+        # prefixes running on past the end of a word
+        start=rng.randint(0, len(value))
+        prefixes.append(' '+value[start:start+rng.randint(1, 8)].upper())
+    for prefix in prefixes:
+        for limit in (None, 1, 3, 25, 0):
+            expected=linear_prefix(weights, prefix, 10 if limit is None else limit)
+            assert index.search(prefix, limit)==expected, (prefix, limit)
+
+
+def test_prefix_search_repeated_words():
+    # a value whose words share a prefix is listed once
+    index=PrefixIndex({'Pizza Pizza': 3, 'Pizza Place': 5, 'Joe\'s Pizza': 1})
+    assert index.search('piz')==[('Pizza Place', 5), ('Pizza Pizza', 3), ("Joe's Pizza", 1)]
+    assert index.search('pizza pl')==[('Pizza Place', 5)]
+
+
+def test_prefix_search_empty_index():
+    index=PrefixIndex({})
+    assert len(index)==0
+    assert index.search('a')==[]
+
+
+def linear_stab(intervals, x):
+    return sorted(payload for start, end, payload in intervals if start<=x<end)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_stab_matches_linear_scan(seed):
+    rng=random.Random(seed)
+    # a small range, so endpoints are shared and empty intervals occur
+    span=rng.choice([10, 100, 10080])
+    intervals=[]
+    for payload in range(rng.randint(0, 300)):
+        start=rng.randint(0, span)
+        intervals.append((start, start+rng.randint(0, span//4), payload))
+    tree=IntervalTree(intervals)
+    assert len(tree)==sum(1 for start, end, _ in intervals if start<end)
+    points=set(p for start, end, _ in intervals for p in (start, end))
+    points.update(rng.randint(-1, span+span//4+1) for _ in range(200))
+    for x in sorted(points):
+        assert sorted(tree.stab(x))==linear_stab(intervals, x), x
+
+
+def test_stab_float_points():
+    rng=random.Random(7)
+    intervals=[]
+    for payload in range(200):
+        start=rng.uniform(0, 1)
+        intervals.append((start, start+rng.uniform(0, 0.3), payload))
+    tree=IntervalTree(intervals)
+    for x in [rng.uniform(-0.1, 1.4) for _ in range(500)]+[start for start, _, _ in intervals]:
+        assert sorted(tree.stab(x))==linear_stab(intervals, x)
+
+
+def test_stab_empty_tree():
+    tree=IntervalTree([])
+    assert len(tree)==0
+    assert tree.stab(5)==[]
@@ -0,0 +1,38 @@
+"""
+A streamed search (stream=1) renders every match, in the same order as
+paging through the search with its keyset cursor.
+"""
+
+import re
+
+import pytest
+
+RID_LINK = re.compile(r'show_restaurant_details\?rid=([^"&]+)')
+
+
+def paged_rids(server, filters, sort, page_size=7):
+    rids=[]
+    after=None
+    conn=server.engine.connect()
+    try:
+        while True:
+            results, after, _ = server.search_restaurants_query(conn, dict(filters), after=after,
+                                                                page_size=page_size, sort=sort)
+            rids+=[row['rid'] for row in results]
+            if after is None:
+                return rids
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('sort', ['rid', 'popular'])
+def test_streamed_search_matches_pages(server, sort):
+    client=server.app.test_client()
+    response=client.post('/search_restaurants_act', data={'min_reviews': '0', 'sort': sort, 'stream': '1'})
+    assert response.status_code==200
+    body=response.get_data(as_text=True)
+    assert '</html>' in body
+    streamed=RID_LINK.findall(body)
+    expected=paged_rids(server, {'min_reviews': 0}, sort)
+    assert len(expected)>7
+    assert streamed==expected
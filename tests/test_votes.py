@@ -0,0 +1,53 @@
+"""
+A user's repeated vote is refused both while it is buffered and after it has
+been flushed, and the review's count only moves once.
+"""
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+
+@pytest.fixture
+def vote(database_uri):
+    """
+    (uid, review_id) of a review the user has not voted on; votes are removed afterwards.
+    """
+    conn=psycopg2.connect(database_uri)
+    conn.autocommit=True
+    cursor=conn.cursor()
+    cursor.execute("""SELECT U.uid, R.review_id FROM users U, reviews R
+                      WHERE NOT EXISTS (SELECT 1 FROM review_votes V WHERE V.uid=U.uid AND V.review_id=R.review_id)
+                      ORDER BY U.uid, R.review_id LIMIT 1""")
+    uid, review_id=cursor.fetchone()
+    cursor.execute("SELECT useful FROM reviews WHERE review_id=%s", (review_id,))
+    useful=cursor.fetchone()[0]
+    try:
+        yield uid, review_id
+    finally:
+        cursor.execute("DELETE FROM review_votes WHERE uid=%s AND review_id=%s", (uid, review_id))
+        cursor.execute("UPDATE reviews SET useful=%s WHERE review_id=%s", (useful, review_id))
+        conn.close()
+
+
+def useful_count(server, buffer, conn, review_id):
+    row=dict(conn.execute("SELECT review_id, useful, funny, cool FROM reviews WHERE review_id=%(review_id)s",
+                          {'review_id': review_id}).first())
+    return buffer.apply([row])[0]['useful']
+
+
+def test_repeat_vote_is_refused_after_flush(server, vote):
+    uid, review_id=vote
+    buffer=server.VoteBuffer(server.engine, interval=0, log_path=None)
+    conn=server.engine.connect()
+    try:
+        before=useful_count(server, buffer, conn, review_id)
+        assert buffer.add(uid, review_id, 'useful', conn)
+        assert not buffer.add(uid, review_id, 'useful', conn)
+        assert useful_count(server, buffer, conn, review_id)==before+1
+        assert buffer.flush()==1
+        assert useful_count(server, buffer, conn, review_id)==before+1
+        assert not buffer.add(uid, review_id, 'useful', conn)
+        assert useful_count(server, buffer, conn, review_id)==before+1
+    finally:
+        conn.close()